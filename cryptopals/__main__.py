@@ -0,0 +1,130 @@
+"""
+    Single entry point for the challenges and their primitives
+
+    python -m cryptopals list
+    python -m cryptopals 6                                  -> runs challenge6.py as a script
+    python -m cryptopals 4 some_hex_lines.txt 5             -> extra args go to the challenge
+    python -m cryptopals hex_to_b64 49276d206b696c6c...      -> runs a primitive
+    python -m cryptopals triage some_dir/ --processes 4     -> see triage.py
+    python -m cryptopals benchmarks --max-size 1MB          -> see benchmarks.py
+    CRYPTOPALS_PROFILE=1 python -m cryptopals 6             -> profiles the primitives, see profiling.py
+
+    Nothing is imported until the command that needs it runs, so XOR-only commands never load
+    cryptography (or numpy, until the XOR autotuner picks it).
+"""
+
+import runpy
+import sys
+from typing import Callable, Dict, List
+
+from paths import data_path
+
+CHALLENGES = [str(number) for number in range(1, 13)]
+
+def read_stdin() -> bytes:
+    return sys.stdin.buffer.read()
+
+def lang_freq_map() -> Dict:
+    import json
+    with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file:
+        return json.load(lang_freq_file)
+
+def hex_to_b64(hex_str: str):
+    from challenge1 import hex_to_b64
+    print(hex_to_b64(hex_str).decode('utf8'))
+
+def fixed_xor(hex_str: str, hex_key: str):
+    from challenge2 import fixed_xor
+    print(fixed_xor(bytes.fromhex(hex_str), bytes.fromhex(hex_key)).hex())
+
+def break_single_byte_xor(hex_str: str):
+    from challenge3 import char_freq_xor_decode, chi_squared_scoring
+    (score, text, key_char) = char_freq_xor_decode(bytes.fromhex(hex_str), lang_freq_map(), 'utf8', chi_squared_scoring)
+    print(f'key: {key_char!r}, score: {score}')
+    print(text)
+
+def repeating_key_xor(key: str):
+    # stdin -> stdout
+    from challenge5 import text_xor_file
+    text_xor_file(sys.stdin.buffer, sys.stdout.buffer, key.encode('utf8'))
+
+def hamming_distance(text1: str, text2: str):
+    from challenge6 import hamming_distance
+    print(hamming_distance(text1.encode('utf8'), text2.encode('utf8')))
+
+def guess_keysize(path: str = None):
+    # base64 ciphertext from a file, or stdin
+    import base64
+    from challenge6 import score_keysizes
+    ciphertext = base64.b64decode(open(path, 'rb').read() if path else read_stdin())
+    for (keysize, score) in score_keysizes(ciphertext)[:5]:
+        print(f'{keysize:>3}: {score:.4f}')
+
+def aes_ecb(mode: str, key: str):
+    # stdin -> stdout
+    from challenge7 import aes_ecb_file
+    aes_ecb_file(sys.stdin.buffer, sys.stdout.buffer, key.encode('utf8'), mode)
+
+def detect_ecb(path: str = None):
+    from challenge8 import scan_ecb
+    with (open(path, 'rt') if path else sys.stdin) as data_file:
+        for record_number, block_counts in scan_ecb(data_file):
+            print(f'record {record_number}: {block_counts}')
+
+def pkcs7_pad(text: str, target_len: str):
+    from challenge9 import pkcs7_padding
+    print(pkcs7_padding(text.encode('utf8'), int(target_len)))
+
+def run_triage(*args: str):
+    from triage import main
+    sys.exit(main(list(args)))
+
+def run_benchmarks(*args: str):
+    from benchmarks import main
+    sys.exit(main(list(args)))
+
+PRIMITIVES: Dict[str, Callable] = {
+    'hex_to_b64': hex_to_b64,
+    'fixed_xor': fixed_xor,
+    'break_single_byte_xor': break_single_byte_xor,
+    'repeating_key_xor': repeating_key_xor,
+    'hamming_distance': hamming_distance,
+    'guess_keysize': guess_keysize,
+    'aes_ecb': aes_ecb,
+    'detect_ecb': detect_ecb,
+    'pkcs7_pad': pkcs7_pad,
+    'triage': run_triage,
+    'benchmarks': run_benchmarks,
+}
+
+def run_challenge(number: str, args: List[str]):
+    # the challenge scripts read their own sys.argv. alter_sys makes the challenge the __main__ module while it
+    # runs, otherwise worker functions defined in it can't be found (or pickled) for a process pool
+    sys.argv = [f'challenge{number}.py'] + args
+    runpy.run_module(f'challenge{number}', run_name='__main__', alter_sys=True)
+
+def print_usage():
+    print(__doc__)
+    print('challenges:', ' '.join(CHALLENGES))
+    print('primitives:', ' '.join(PRIMITIVES))
+
+def main(argv: List[str]) -> int:
+    if not argv or argv[0] in ('list', '-h', '--help'):
+        print_usage()
+        return 0
+
+    (name, args) = (argv[0], argv[1:])
+    name = name[len('challenge'):] if name.startswith('challenge') else name
+
+    if name in CHALLENGES:
+        run_challenge(name, args)
+    elif name in PRIMITIVES:
+        PRIMITIVES[name](*args)
+    else:
+        print(f'unknown challenge or primitive: {argv[0]}', file=sys.stderr)
+        print_usage()
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,223 @@
+"""
+    Size-sweep benchmarks for the cryptopals primitives
+
+    python benchmarks.py                          -> runs everything from 1KB to 100MB and compares to the baseline
+    python benchmarks.py --max-size 1MB --save    -> quick run, saved as the new baseline
+    python benchmarks.py --only fixed_xor text_xor --sizes 1KB 1MB
+
+    Throughput is reported in MB/s of input. Anything that falls more than --threshold below the
+    baseline is flagged as a regression (and the exit code is 1).
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+from challenge2 import cache_dir
+
+SIZES = [1 << 10, 10 << 10, 100 << 10, 1 << 20, 10 << 20, 100 << 20]
+UNITS = {'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30}
+
+KEY = b'YELLOW SUBMARINE'
+IV = b'\x00' * 16
+
+def parse_size(size: str) -> int:
+    size = size.upper()
+    for unit, multiplier in UNITS.items():
+        if size.endswith(unit):
+            return int(float(size[:-len(unit)]) * multiplier)
+    return int(size)
+
+def format_size(size: int) -> str:
+    for unit, multiplier in reversed(UNITS.items()):
+        if size >= multiplier and size % multiplier == 0:
+            return f'{size // multiplier}{unit}'
+    return str(size)
+
+def english_bytes(size: int) -> bytes:
+    from challenge6 import Tests
+    text = (Tests.get_gettysberg_address() + ' ').encode('utf8')
+    return (text * (size // len(text) + 1))[:size]
+
+# each benchmark takes an input size and returns a zero argument callable that processes that many bytes,
+# imports happen in here so a run only loads what it benchmarks
+
+def bench_hex_to_b64(size: int) -> Callable:
+    from challenge1 import hex_to_b64
+    # size is the number of decoded bytes
+    hex_str = os.urandom(size).hex()
+    return lambda: hex_to_b64(hex_str)
+
+def bench_fixed_xor(size: int) -> Callable:
+    from challenge2 import fixed_xor
+    operand, key = os.urandom(size), os.urandom(size)
+    return lambda: fixed_xor(operand, key)
+
+def bench_text_xor(size: int) -> Callable:
+    from challenge5 import text_xor
+    text = os.urandom(size)
+    return lambda: text_xor(text, b'ICE')
+
+def bench_char_freq_xor_decode(size: int) -> Callable:
+    from challenge3 import char_freq_xor_decode, chi_squared_scoring, single_byte_xor
+    from paths import data_path
+    with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file:
+        lang_freq_map = json.load(lang_freq_file)
+    ciphertext = single_byte_xor(english_bytes(size), ord('X'))
+    return lambda: char_freq_xor_decode(ciphertext, lang_freq_map, 'utf8', chi_squared_scoring)
+
+def bench_hamming_distance(size: int) -> Callable:
+    from challenge6 import hamming_distance
+    src, target = os.urandom(size), os.urandom(size)
+    return lambda: hamming_distance(src, target)
+
+def bench_guess_keysize(size: int) -> Callable:
+    from challenge5 import text_xor
+    from challenge6 import guess_keysize
+    ciphertext = text_xor(english_bytes(size), b'timmy')
+    return lambda: guess_keysize(ciphertext)
+
+def bench_encrypt_aes_ecb(size: int) -> Callable:
+    from challenge7 import encrypt_aes_ecb
+    plaintext = os.urandom(size)
+    return lambda: encrypt_aes_ecb(plaintext, KEY)
+
+def bench_decrypt_aes_ecb(size: int) -> Callable:
+    from challenge7 import decrypt_aes_ecb
+    ciphertext = os.urandom(size - size % 16)
+    return lambda: decrypt_aes_ecb(ciphertext, KEY)
+
+def bench_cbc_encrypt(size: int) -> Callable:
+    from challenge10 import cipher_block_chaining
+    plaintext = os.urandom(size)
+    return lambda: cipher_block_chaining(plaintext, KEY, IV, 'encrypt')
+
+def bench_cbc_decrypt(size: int) -> Callable:
+    from challenge10 import cipher_block_chaining
+    ciphertext = os.urandom(size - size % 16)
+    return lambda: cipher_block_chaining(ciphertext, KEY, IV, 'decrypt')
+
+def bench_cbc_native_encrypt(size: int) -> Callable:
+    from challenge10 import cipher_block_chaining
+    plaintext = os.urandom(size)
+    return lambda: cipher_block_chaining(plaintext, KEY, IV, 'encrypt', fast=True)
+
+def bench_cbc_native_decrypt(size: int) -> Callable:
+    from challenge10 import cipher_block_chaining
+    ciphertext = os.urandom(size - size % 16)
+    return lambda: cipher_block_chaining(ciphertext, KEY, IV, 'decrypt', fast=True)
+
+def bench_cbc_bulk_decrypt(size: int) -> Callable:
+    from challenge10 import cbc_decrypt_bulk
+    ciphertext = os.urandom(size - size % 16)
+    return lambda: cbc_decrypt_bulk(ciphertext, KEY, IV, unpad=False)
+
+def bench_is_aes_ecb(size: int) -> Callable:
+    from challenge8 import is_aes_ecb
+    # random blocks never repeat, so this is always a full scan
+    ciphertext = os.urandom(size)
+    return lambda: is_aes_ecb(ciphertext)
+
+BENCHMARKS: Dict[str, Callable] = {
+    'hex_to_b64': bench_hex_to_b64,
+    'fixed_xor': bench_fixed_xor,
+    'text_xor': bench_text_xor,
+    'char_freq_xor_decode': bench_char_freq_xor_decode,
+    'hamming_distance': bench_hamming_distance,
+    'guess_keysize': bench_guess_keysize,
+    'encrypt_aes_ecb': bench_encrypt_aes_ecb,
+    'decrypt_aes_ecb': bench_decrypt_aes_ecb,
+    'cbc_encrypt': bench_cbc_encrypt,
+    'cbc_decrypt': bench_cbc_decrypt,
+    'cbc_native_encrypt': bench_cbc_native_encrypt,
+    'cbc_native_decrypt': bench_cbc_native_decrypt,
+    'cbc_bulk_decrypt': bench_cbc_bulk_decrypt,
+    'is_aes_ecb': bench_is_aes_ecb,
+}
+
+def time_callable(fn: Callable, min_time: float = 0.2, repeat: int = 3) -> float:
+    # best seconds per call, calls are batched up until a batch takes at least min_time.
+    # the first call is a warm up: lazy imports, the xor autotuner, compiled models
+    fn()
+    start = time.perf_counter()
+    fn()
+    single = time.perf_counter() - start
+    if single >= min_time:
+        return single
+
+    number = max(1, int(min_time / max(single, 1e-9)))
+    best = single
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def run_suite(names: List[str], sizes: List[int], min_time: float = 0.2, report: Callable = print) -> Dict[str, Dict[str, float]]:
+    # returns {benchmark name: {size: MB/s}}
+    results = {}
+    for name in names:
+        results[name] = {}
+        for size in sizes:
+            fn = BENCHMARKS[name](size)
+            seconds = time_callable(fn, min_time)
+            mb_per_sec = size / (1 << 20) / seconds
+            results[name][format_size(size)] = mb_per_sec
+            report(f'{name:<22} {format_size(size):>6} {mb_per_sec:>12.2f} MB/s')
+    return results
+
+def find_regressions(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    for name, by_size in results.items():
+        for size, mb_per_sec in by_size.items():
+            baseline_mb_per_sec = baseline.get(name, {}).get(size)
+            if baseline_mb_per_sec and mb_per_sec < baseline_mb_per_sec * (1 - threshold):
+                change = (mb_per_sec / baseline_mb_per_sec - 1) * 100
+                regressions.append(f'{name} @ {size}: {mb_per_sec:.2f} MB/s vs baseline {baseline_mb_per_sec:.2f} MB/s ({change:+.1f}%)')
+    return regressions
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description='size-sweep benchmarks for the cryptopals primitives')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run (default: all)')
+    parser.add_argument('--sizes', nargs='+', type=parse_size, help='input sizes, ie: 1KB 10MB (default: 1KB to 100MB)')
+    parser.add_argument('--max-size', type=parse_size, help='skip sizes bigger than this')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to spend timing each size')
+    parser.add_argument('--baseline', default=os.path.join(cache_dir(), 'benchmark_baseline.json'), help='baseline results json')
+    parser.add_argument('--save', action='store_true', help='merge these results into the baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown vs baseline that counts as a regression (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    names = args.only or list(BENCHMARKS)
+    sizes = args.sizes or SIZES
+    if args.max_size:
+        sizes = [size for size in sizes if size <= args.max_size]
+
+    results = run_suite(names, sizes, args.min_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    for regression in regressions:
+        print('REGRESSION:', regression)
+    if baseline and not regressions:
+        print('>> no regressions against', args.baseline)
+
+    if args.save:
+        for name, by_size in results.items():
+            baseline.setdefault(name, {}).update(by_size)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+        print('>> saved baseline to', args.baseline)
+
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
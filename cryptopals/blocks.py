@@ -0,0 +1,111 @@
+"""
+    Zero-copy block views
+
+    chunk_text slices out a copy of every block. BlockView splits bytes/bytearray/mmap (anything with the
+    buffer protocol) into memoryview slices instead, so walking the blocks of a big ciphertext allocates
+    nothing but the views themselves:
+
+    blocks = BlockView(ciphertext, 16)
+    blocks[0], blocks[-1]          -> first and last block (the last one may be partial)
+    blocks[2:5]                    -> list of blocks 2, 3 and 4
+    blocks.iter_full()             -> every whole block, skipping a trailing partial one
+    blocks.padded()                -> every block, with the trailing partial block PKCS#7 padded
+    blocks.column(3)               -> byte 3 of every block, as a strided view (Vigenère transposition)
+
+    Views over a bytearray keep it from being resized while they're alive, and they see any writes to it.
+"""
+
+from typing import Iterator, List, Union
+
+from challenge9 import pkcs7_padding
+
+class BlockView:
+    def __init__(self, data, block_size: int = 16):
+        if block_size < 1:
+            raise ValueError('Block size must be positive!')
+        self.view = data if isinstance(data, memoryview) else memoryview(data)
+        if self.view.ndim != 1 or self.view.itemsize != 1:
+            self.view = self.view.cast('B')
+        self.block_size = block_size
+
+    @property
+    def full_blocks(self) -> int:
+        return len(self.view) // self.block_size
+
+    @property
+    def remainder(self) -> memoryview:
+        # the trailing partial block, empty when the data is block aligned
+        return self.view[self.full_blocks * self.block_size:]
+
+    def __len__(self) -> int:
+        # a trailing partial block counts, like chunk_text
+        return -(-len(self.view) // self.block_size)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[memoryview, List[memoryview]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        num_blocks = len(self)
+        if index < 0:
+            index += num_blocks
+        if not 0 <= index < num_blocks:
+            raise IndexError('block index out of range')
+
+        start = index * self.block_size
+        return self.view[start:start + self.block_size]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        view, block_size = self.view, self.block_size
+        for i in range(0, len(view), block_size):
+            yield view[i:i+block_size]
+
+    def iter_full(self) -> Iterator[memoryview]:
+        # only the whole blocks, a trailing partial block is skipped
+        view, block_size = self.view, self.block_size
+        for i in range(0, self.full_blocks * block_size, block_size):
+            yield view[i:i+block_size]
+
+    def padded(self) -> Iterator[Union[memoryview, bytes]]:
+        # same as iterating, but a trailing partial block comes out padded (as a copy, it can't be a view).
+        # block aligned data gets no extra pad block, that's what the ECB and CBC code here expect
+        yield from self.iter_full()
+        remainder = self.remainder
+        if remainder:
+            yield pkcs7_padding(bytes(remainder), self.block_size)
+
+    def column(self, index: int) -> memoryview:
+        # byte index of every block, partial last block included. the view is strided, bytes() it for a
+        # contiguous copy
+        if not 0 <= index < self.block_size:
+            raise IndexError('column index out of range')
+        return self.view[index::self.block_size]
+
+    def columns(self) -> List[memoryview]:
+        return [self.view[i::self.block_size] for i in range(min(self.block_size, len(self.view)))]
+
+if __name__ == "__main__":
+    text = b"YELLOW SUBMARINEyellow submarine!"
+    blocks = BlockView(text, 16)
+
+    assert len(blocks) == 3 and blocks.full_blocks == 2
+    assert list(blocks) == [text[0:16], text[16:32], text[32:]]
+    assert blocks[-1] == b'!' and blocks[-3] == b'YELLOW SUBMARINE'
+    assert blocks[1:] == [text[16:32], text[32:]]
+    assert blocks.remainder == b'!'
+    assert list(blocks.iter_full()) == [text[0:16], text[16:32]]
+    assert list(blocks.padded())[-1] == b'!' + b'\x0f' * 15
+    assert len(list(BlockView(text[:32], 16).padded())) == 2
+    assert bytes(blocks.column(0)) == text[0::16]
+    assert [bytes(col) for col in BlockView(text, 5).columns()] == [text[i::5] for i in range(5)]
+
+    try:
+        blocks[3]
+        assert False
+    except IndexError:
+        pass
+
+    buffer = bytearray(text)
+    BlockView(buffer, 16)[0][:6] = b'yellow'
+    assert buffer.startswith(b'yellow SUBMARINE')
+
+    print('block view tests passed!')
@@ -12,14 +12,21 @@
     The file here is intelligible (somewhat) when CBC decrypted against "YELLOW SUBMARINE" with an IV of all ASCII 0 (\x00\x00\x00 &c) 
 """
 
-from base64 import b64decode
-from typing import Literal
-
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+import random
+import time
+from functools import partial
+from math import inf
+from typing import Dict, Literal
 
+from challenge2 import fixed_xor
 from challenge5 import text_xor
-from challenge6 import chunk_text
-from challenge9 import pkcs7_padding
+from challenge7 import AES_BLOCK_SIZE, aes_ecb_context, decrypt_aes_ecb
+from challenge9 import pkcs7_padding, pkcs7_unpadding
+from blocks import BlockView
+from paths import data_path
+from pipeline import b64_decode, pkcs7_unpad, run_pipeline, utf8_decode
+from pipeline import cbc_decrypt as pipeline_cbc_decrypt
+from profiling import profiled
 
 
 def cbc_encrypt(plaintext: bytes, xor_input: bytes, encryptor):
@@ -35,43 +42,236 @@ def cbc_decrypt(ciphertext: bytes, xor_input: bytes, decryptor):
 
     return decrypted, next_input
     
-def cipher_block_chaining(plaintext: bytes, key: bytes, init_vector: bytes, mode: Literal["encrypt", "decrypt"]) -> bytes:
-    algorithm = algorithms.AES(key)
-    cipher = Cipher(algorithm, mode=modes.ECB())
-    
+class CbcEncryptor:
+    """
+        Incremental version of cipher_block_chaining(..., 'encrypt') built on cbc_encrypt.
+        The chaining value and any partial block are carried between update() calls, and every full
+        block is encrypted and returned as soon as it's available. finalize() pads the last partial block.
+
+        full_block_padding=True is standard PKCS#7 instead: aligned input gets a whole pad block, which is
+        what CbcDecryptor(unpad=True) expects.
+    """
+
+    def __init__(self, key: bytes, init_vector: bytes, full_block_padding: bool = False):
+        # only whole blocks ever go through it, so the shared context will do
+        self._encryptor = aes_ecb_context(key, 'encrypt')
+        self._next_input = init_vector
+        self._remainder = b''
+        self._full_block_padding = full_block_padding
+
+    def update(self, data: bytes) -> bytes:
+        data = self._remainder + bytes(data)
+        full_len = len(data) - len(data) % AES_BLOCK_SIZE
+        self._remainder = data[full_len:]
+
+        result_chunks = []
+        for block in BlockView(memoryview(data)[:full_len], AES_BLOCK_SIZE):
+            result, self._next_input = cbc_encrypt(block, self._next_input, self._encryptor)
+            result_chunks.append(result)
+        return b''.join(result_chunks)
+
+    def finalize(self) -> bytes:
+        if not self._remainder and not self._full_block_padding:
+            return b''
+
+        result, self._next_input = cbc_encrypt(pkcs7_padding(self._remainder, AES_BLOCK_SIZE), self._next_input, self._encryptor)
+        self._remainder = b''
+        return result
+
+class CbcDecryptor:
+    """
+        Incremental version of cipher_block_chaining(..., 'decrypt') built on cbc_decrypt.
+        With unpad=True the newest full block is held back until finalize() so the padding can be stripped from it,
+        so the ciphertext has to be standard PKCS#7, ie: from CbcEncryptor(..., full_block_padding=True).
+    """
+
+    def __init__(self, key: bytes, init_vector: bytes, unpad: bool = False):
+        self._decryptor = aes_ecb_context(key, 'decrypt')
+        self._next_input = init_vector
+        self._remainder = b''
+        self._unpad = unpad
+
+    def update(self, data: bytes) -> bytes:
+        data = self._remainder + bytes(data)
+        full_len = len(data) - len(data) % AES_BLOCK_SIZE
+        if self._unpad and full_len == len(data):
+            # keep the last block back, it might be the one with the padding
+            full_len = max(full_len - AES_BLOCK_SIZE, 0)
+        self._remainder = data[full_len:]
+
+        result_chunks = []
+        for block in BlockView(memoryview(data)[:full_len], AES_BLOCK_SIZE):
+            result, self._next_input = cbc_decrypt(block, self._next_input, self._decryptor)
+            result_chunks.append(result)
+        return b''.join(result_chunks)
+
+    def finalize(self) -> bytes:
+        if len(self._remainder) % AES_BLOCK_SIZE:
+            raise ValueError('Ciphertext length must be a multiple of the block size!')
+        if not self._remainder:
+            if self._unpad:
+                raise ValueError('Invalid padding!')
+            return b''
+
+        result, self._next_input = cbc_decrypt(self._remainder, self._next_input, self._decryptor)
+        self._remainder = b''
+        return pkcs7_unpadding(result, AES_BLOCK_SIZE) if self._unpad else result
+
+@profiled
+def cbc_decrypt_bulk(ciphertext: bytes, key: bytes, init_vector: bytes, unpad: bool = False) -> bytes:
+    """
+        Decryption doesn't actually need to chain: plaintext block i is D(C[i]) ^ C[i-1].
+        So the whole ciphertext is ECB decrypted in one call and xor'd against itself shifted by a block
+        (with the IV in front). With unpad=True the padding is checked and stripped once at the end, that's
+        only for standard PKCS#7 ciphertexts ('encrypt' adds no pad block to aligned input).
+    """
+    if len(ciphertext) % AES_BLOCK_SIZE:
+        raise ValueError('Ciphertext length must be a multiple of the block size!')
+    if not ciphertext:
+        return b''
+
+    decrypted = memoryview(decrypt_aes_ecb(ciphertext, key))
+    ciphertext = memoryview(ciphertext)
+
+    plaintext = fixed_xor(decrypted[:AES_BLOCK_SIZE], init_vector) + fixed_xor(decrypted[AES_BLOCK_SIZE:], ciphertext[:-AES_BLOCK_SIZE])
+
+    if unpad:
+        plaintext = pkcs7_unpadding(plaintext, AES_BLOCK_SIZE)
+    return plaintext
+
+def cbc_native(plaintext: bytes, key: bytes, init_vector: bytes, mode: Literal["encrypt", "decrypt"]) -> bytes:
+    """
+        cipher_block_chaining(..., fast=True): the same output, from OpenSSL's CBC in one call.
+        Padding matches the hand rolled version, only a trailing partial block gets padded (either way).
+    """
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    remainder_len = len(plaintext) % AES_BLOCK_SIZE
+    if remainder_len:
+        plaintext = bytes(plaintext) + pkcs7_padding(b'', AES_BLOCK_SIZE - remainder_len)
+
+    cipher = Cipher(algorithms.AES(key), modes.CBC(init_vector))
+    if mode == 'encrypt':
+        context = cipher.encryptor()
+    elif mode == 'decrypt':
+        context = cipher.decryptor()
+    else:
+        raise ValueError('Invalid mode!')
+    return context.update(plaintext) + context.finalize()
+
+@profiled
+def cipher_block_chaining(plaintext: bytes, key: bytes, init_vector: bytes, mode: Literal["encrypt", "decrypt", "bulk_decrypt"], fast: bool = False) -> bytes:
+    """
+        The hand rolled CBC, one block at a time through cbc_encrypt/cbc_decrypt.
+        fast=True hands encrypt/decrypt to the native CBC mode instead (see differential_harness).
+    """
+    if mode == 'bulk_decrypt':
+        return cbc_decrypt_bulk(plaintext, key, init_vector)
+    if fast:
+        return cbc_native(plaintext, key, init_vector, mode)
+
     cbc_fn = None
     cbc_actor = None
     
     if mode == 'decrypt':
         cbc_fn = cbc_decrypt
-        cbc_actor = cipher.decryptor()
+        cbc_actor = aes_ecb_context(key, 'decrypt')
     elif mode == 'encrypt':
         cbc_fn = cbc_encrypt
-        cbc_actor = cipher.encryptor()
+        cbc_actor = aes_ecb_context(key, 'encrypt')
     else:
-        raise 'Invalid mode!'
+        raise ValueError('Invalid mode!')
     
-    block_size = len(key)
+    # AES blocks are 16 bytes whatever the key size
+    block_size = AES_BLOCK_SIZE
 
     result_chunks = []
     next_input = init_vector
 
-    chunks = chunk_text(plaintext, block_size)
-    for chunk in chunks:
-        chunk = pkcs7_padding(chunk, block_size)
+    # views over the input, only a trailing partial block gets copied (to be padded)
+    for chunk in BlockView(plaintext, block_size).padded():
         result, next_input = cbc_fn(chunk, next_input, cbc_actor)
         result_chunks.append(result)
 
     return b''.join(result_chunks)
 
+def differential_harness(trials: int = 500, max_len: int = 256, seed: int = 0) -> Dict:
+    """
+        Checks cipher_block_chaining against its fast=True path over random keys (all three AES sizes), IVs
+        and lengths (block aligned or not, 0 included), encrypt and decrypt both. Also times the two paths.
+
+        returns {'trials', 'mismatches': [(mode, key, iv, input)], 'hand_rolled_seconds', 'native_seconds', 'speedup'}
+    """
+    rng = random.Random(seed)
+    mismatches = []
+    hand_rolled_seconds = 0.0
+    native_seconds = 0.0
+
+    for _ in range(trials):
+        key = rng.randbytes(rng.choice((16, 24, 32)))
+        init_vector = rng.randbytes(AES_BLOCK_SIZE)
+        data = rng.randbytes(rng.randint(0, max_len))
+
+        for mode in ('encrypt', 'decrypt'):
+            start = time.perf_counter()
+            expected = cipher_block_chaining(data, key, init_vector, mode)
+            hand_rolled_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            actual = cipher_block_chaining(data, key, init_vector, mode, fast=True)
+            native_seconds += time.perf_counter() - start
+
+            if actual != expected:
+                mismatches.append((mode, key, init_vector, data))
+
+    return {
+        'trials': trials * 2,
+        'mismatches': mismatches,
+        'hand_rolled_seconds': hand_rolled_seconds,
+        'native_seconds': native_seconds,
+        'speedup': hand_rolled_seconds / native_seconds if native_seconds else inf,
+    }
+
 if __name__ == "__main__":
-    with open('./10.txt', 'rt') as data_file:    
-        encoded_text = b64decode(data_file.read().strip())
+    # every mode has to round trip, block aligned lengths included
+    key = b"YELLOW SUBMARINE"
+    init_vector = bytes(range(16))
+    for length in (0, 15, 16, 31, 32, 33, 48):
+        plaintext = b'A' * (length - 1) + b'\x01' if length else b''
+        ciphertext = cipher_block_chaining(plaintext, key, init_vector, 'encrypt')
+        decrypted = cipher_block_chaining(ciphertext, key, init_vector, 'decrypt')
+        assert cipher_block_chaining(ciphertext, key, init_vector, 'bulk_decrypt') == decrypted
+        if length % AES_BLOCK_SIZE == 0:
+            assert decrypted == plaintext
+        else:
+            assert decrypted == pkcs7_padding(plaintext, len(ciphertext))
+    print('>> encrypt / decrypt / bulk_decrypt round trip')
+
+    for length in (0, 15, 16, 31, 32, 33, 48):
+        plaintext = bytes(range(length))
+        encryptor = CbcEncryptor(key, init_vector, full_block_padding=True)
+        ciphertext = encryptor.update(plaintext[:7]) + encryptor.update(plaintext[7:]) + encryptor.finalize()
+        assert len(ciphertext) == (length // AES_BLOCK_SIZE + 1) * AES_BLOCK_SIZE
+
+        decryptor = CbcDecryptor(key, init_vector, unpad=True)
+        assert decryptor.update(ciphertext[:5]) + decryptor.update(ciphertext[5:]) + decryptor.finalize() == plaintext
+    print('>> CbcEncryptor / CbcDecryptor round trip')
+
+    report = differential_harness()
+    assert not report['mismatches'], report['mismatches'][:3]
+    print(f">> hand rolled and native CBC agree on {report['trials']} random trials, native is {report['speedup']:.1f}x faster")
+
+    # bigger inputs is where the per block python overhead really shows
+    report = differential_harness(trials=20, max_len=1 << 16, seed=1)
+    assert not report['mismatches']
+    print(f">> up to 64KB: native is {report['speedup']:.1f}x faster")
+
+    with open(data_path('10.txt'), 'rb') as data_file:    
         key = b"YELLOW SUBMARINE"
         init_vector = b"\x00" * 16
 
-        actual = cipher_block_chaining(encoded_text, key, init_vector, 'decrypt')
-
-        plaintext = actual.decode('utf8')
+        # base64 -> CBC -> unpad -> text, a chunk at a time
+        plaintext = run_pipeline(data_file, b64_decode, partial(pipeline_cbc_decrypt, key=key, init_vector=init_vector), pkcs7_unpad, utf8_decode)
 
-        print(plaintext)
+        for text in plaintext:
+            print(text, end='')
@@ -19,41 +19,125 @@
     Detect the block cipher mode the function is using each time. You should end up with a piece of code that, pointed at a block box that might be encrypting ECB or CBC, tells you which one is happening.
 """
 
+import os
+import random
 import secrets
-from typing import Literal
+import time
+from typing import Callable, Dict, Iterable, List, Literal, Tuple
 
 from challenge7 import encrypt_aes_ecb
 from challenge8 import is_aes_ecb
 from challenge10 import cipher_block_chaining
 
 
-def gen_rand_bytes(num_bytes: int = 16) -> bytes:
+# rng is an optional random.Random for reproducible runs, by default everything comes from secrets
+def gen_rand_bytes(num_bytes: int = 16, rng: random.Random = None) -> bytes:
+    if rng is not None:
+        return rng.randbytes(num_bytes)
     return secrets.token_bytes(num_bytes)
 
-def encryption_oracle(input_str: str, key: bytes = None) -> bytes:
-    prefix_bytes = gen_rand_bytes(secrets.choice(range(5,11)))
-    suffix_bytes = gen_rand_bytes(secrets.choice(range(5,11)))
+def encryption_oracle(input_str: str, key: bytes = None, rng: random.Random = None) -> bytes:
+    choice = secrets.choice if rng is None else rng.choice
+    randbelow = secrets.randbelow if rng is None else rng.randrange
+
+    prefix_bytes = gen_rand_bytes(choice(range(5,11)), rng)
+    suffix_bytes = gen_rand_bytes(choice(range(5,11)), rng)
     plaintext_bytes = prefix_bytes + input_str.encode('utf8') + suffix_bytes
 
-    if key is None:
-        key = gen_rand_bytes(16)
+    # a fresh random key is only ever used once, caching a context for it would only churn ECB_CONTEXTS
+    one_off_key = key is None
+    if one_off_key:
+        key = gen_rand_bytes(16, rng)
 
     ciphertext = None
     mode = None
 
-    if secrets.randbelow(2) == 0:
+    if randbelow(2) == 0:
         mode = 'ECB'
-        ciphertext = encrypt_aes_ecb(plaintext_bytes, key)
+        ciphertext = encrypt_aes_ecb(plaintext_bytes, key, cached=not one_off_key)
     else:
         mode = 'CBC'
-        iv = gen_rand_bytes(16)
-        ciphertext = cipher_block_chaining(plaintext_bytes, key, iv, 'encrypt')
+        iv = gen_rand_bytes(16, rng)
+        # same output either way, the native one builds its own context rather than using the shared cache
+        ciphertext = cipher_block_chaining(plaintext_bytes, key, iv, 'encrypt', fast=one_off_key)
 
     return ciphertext, mode
 
 def is_ecb_or_cbc(ciphertext: bytes) -> Literal['ECB', 'CBC']:
     return 'ECB' if is_aes_ecb(ciphertext, 16) else 'CBC'
 
+def run_trials(trial_shard: Tuple[int, int, int, int], detector: Callable = is_ecb_or_cbc) -> Tuple[int, int, int, float]:
+    # module level so it can be shipped to worker processes.
+    # every shard gets its own rng seeded from (seed, input length, shard), so a run is reproducible however it's split up
+    (seed, input_len, shard_index, num_trials) = trial_shard
+    rng = random.Random(f'{seed}-{input_len}-{shard_index}')
+    plaintext = 'A' * input_len
+
+    correct = 0
+    start_time = time.perf_counter()
+    for _ in range(num_trials):
+        ciphertext, expected_mode = encryption_oracle(plaintext, rng=rng)
+        if detector(ciphertext) == expected_mode:
+            correct += 1
+    return input_len, correct, num_trials, time.perf_counter() - start_time
+
+def trial_harness(input_lengths: Iterable[int], trials_per_length: int = 10000, detector: Callable = is_ecb_or_cbc, seed: int = 0, shard_size: int = 1000, processes: int = None) -> Tuple[List[Dict], float]:
+    """
+        Runs trials_per_length oracle + detector trials for every input length, split into shards. processes > 1
+        runs the shards across a process pool, by default they run here. The detector has to be a module level
+        function so it can be pickled.
+
+        returns one {'input_len', 'trials', 'correct', 'accuracy', 'seconds', 'trials_per_sec'} dict per input length,
+        where seconds is the time spent in trials of that length summed over the workers, plus the overall
+        trials/sec of the whole run (wall clock)
+    """
+    input_lengths = list(input_lengths)
+    shards = [
+        (seed, input_len, shard_index, min(shard_size, trials_per_length - start))
+        for input_len in input_lengths
+        for shard_index, start in enumerate(range(0, trials_per_length, shard_size))
+    ]
+
+    totals = {input_len: [0, 0, 0.0] for input_len in input_lengths}
+    start_time = time.perf_counter()
+
+    if processes is not None and processes > 1:
+        from concurrent.futures import ProcessPoolExecutor # only paid for when a pool is used
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            shard_results = list(executor.map(run_trials, shards, [detector] * len(shards)))
+    else:
+        shard_results = [run_trials(shard, detector) for shard in shards]
+
+    elapsed = time.perf_counter() - start_time
+    for (input_len, correct, num_trials, seconds) in shard_results:
+        totals[input_len][0] += correct
+        totals[input_len][1] += num_trials
+        totals[input_len][2] += seconds
+
+    report = []
+    for input_len in input_lengths:
+        (correct, num_trials, seconds) = totals[input_len]
+        report.append({
+            'input_len': input_len,
+            'trials': num_trials,
+            'correct': correct,
+            'accuracy': correct / num_trials if num_trials else 0.0,
+            'seconds': seconds,
+            'trials_per_sec': num_trials / seconds if seconds > 0 else 0.0,
+        })
+
+    total_trials = sum(num_trials for (_, num_trials, _) in totals.values())
+    return report, total_trials / elapsed if elapsed > 0 else 0.0
+
+def shortest_reliable_input(report: List[Dict]) -> int:
+    # shortest input length from which every longer length in the sweep is detected 100% of the time, None if there isn't one
+    shortest = None
+    for row in sorted(report, key=lambda row: row['input_len'], reverse=True):
+        if row['accuracy'] < 1.0:
+            break
+        shortest = row['input_len']
+    return shortest
+
 def get_gettysberg_address():
     address = """ 
         Four score and seven years ago our fathers brought forth on this continent, a new nation, conceived in Liberty, and dedicated to the proposition that all men are created equal.
@@ -64,18 +148,9 @@ def get_gettysberg_address():
 
 
 if __name__ == "__main__":
-    plaintext = 'Arbitrary data to encrypt ' * 50 #get_gettysberg_address()
-
-    results = {
-        'correct': 0,
-        'incorrect': 0
-    }
-
-    for i in range(100):
-        ciphertext, expected_mode = encryption_oracle(plaintext)
-        actual_mode = is_ecb_or_cbc(ciphertext)
-        
-        res_key = 'correct' if actual_mode == expected_mode else 'incorrect'
-        results[res_key] += 1
+    report, trials_per_sec = trial_harness(range(0, 65), trials_per_length=2000, processes=os.cpu_count())
 
-    print(results)
+    for row in report:
+        print(f"input length {row['input_len']:>3}: accuracy {row['accuracy']:.4f} ({row['correct']}/{row['trials']}), {row['trials_per_sec']:.0f} trials/sec")
+    print(f">> {trials_per_sec:.0f} trials/sec overall")
+    print('>> shortest input with 100% detection:', shortest_reliable_input(report))
@@ -1,41 +1,155 @@
+import itertools
 import secrets
+from typing import Callable, Dict, List, Tuple, Union
 
-from challenge7 import encrypt_aes_ecb
+from challenge7 import ECB_CONTEXTS, encrypt_aes_ecb
 from challenge8 import is_aes_ecb
 from challenge10 import cipher_block_chaining
 from challenge11 import encryption_oracle
 from base64 import b64decode
+from oracle_instrumentation import InstrumentedOracle
 
 def gen_rand_bytes(num_bytes: int = 16) -> bytes:
     return secrets.token_bytes(num_bytes)
 
-def encryption_oracle(input_str: str, key: bytes = None) -> bytes:
-    # prefix_bytes = gen_rand_bytes(secrets.choice(range(5,11)))
-    # suffix_bytes = gen_rand_bytes(secrets.choice(range(5,11)))
-    # plaintext_bytes = prefix_bytes + input_str.encode('utf8') + suffix_bytes
+# consistent but unknown key, generated once per run
+CONSISTENT_KEY = gen_rand_bytes(16)
 
-    prefix_bytes = b"""Um9sbGluJyBpbiBteSA1LjAKV2l0aCBteSByYWctdG9wIGRvd24gc28gbXkg
+UNKNOWN_STRING = b"""Um9sbGluJyBpbiBteSA1LjAKV2l0aCBteSByYWctdG9wIGRvd24gc28gbXkg
 aGFpciBjYW4gYmxvdwpUaGUgZ2lybGllcyBvbiBzdGFuZGJ5IHdhdmluZyBq
 dXN0IHRvIHNheSBoaQpEaWQgeW91IHN0b3A/IE5vLCBJIGp1c3QgZHJvdmUg
 YnkK"""
 
-    # plaintext_bytes = prefix_bytes + input_str.encode('utf8')
-    plaintext_bytes = input_str.encode('utf8')
+def encryption_oracle(input_str: Union[str, bytes], key: bytes = None) -> bytes:
+    # AES-128-ECB(your-string || unknown-string, random-key)
+    input_bytes = input_str.encode('utf8') if isinstance(input_str, str) else input_str
+    plaintext_bytes = input_bytes + b64decode(UNKNOWN_STRING)
 
     if key is None:
-        key = gen_rand_bytes(16)
+        key = CONSISTENT_KEY
 
     ciphertext = encrypt_aes_ecb(plaintext_bytes, key)
 
     return ciphertext
 
-def ecb_replay_attack(plaintext: bytes):
-    block_size = 1
-    for i in range(1, 100):
-        block_size = i
-        buffer = plaintext[0] * i
-        # print(res)
+class ByteAtATimeEcbAttack:
+    """
+        Byte-at-a-time ECB decryption of whatever an oracle appends to our input.
+
+        Every distinct input is only ever sent to the oracle once (responses are cached), and the 256 possible
+        values of each unknown byte are tested with a single oracle call: ECB encrypts blocks independently,
+        so all 256 crafted blocks can go in one input and their ciphertexts read back block by block.
+        The target block for an unknown byte only depends on the pad length (block_size possible values),
+        so those probes are shared by every block of the secret.
+
+        oracle_calls is the cost of the attack, cache_hits is how many queries it didn't have to make.
+
+        Queries that don't depend on each other go out together through query_many(). If the oracle has a
+        map(inputs) method (http_oracle.HttpOracle does) they're sent concurrently, otherwise one at a time.
+        candidates_per_query < 256 splits the candidate blocks over several queries, for oracles that cap
+        the input size, and those go out together too.
+    """
+
+    def __init__(self, oracle: Callable[[bytes], bytes], full_block_padding: bool = False, candidates_per_query: int = 256):
+        self.oracle = oracle
+        # encrypt_aes_ecb only pads a trailing partial block, standard PKCS#7 adds a whole block when aligned
+        self.full_block_padding = full_block_padding
+        self.candidates_per_query = candidates_per_query
+        self.oracle_calls = 0
+        self.cache_hits = 0
+        self._cache: Dict[bytes, bytes] = {}
+
+    def query(self, input_bytes: bytes) -> bytes:
+        ciphertext = self._cache.get(input_bytes)
+        if ciphertext is None:
+            self.oracle_calls += 1
+            ciphertext = self.oracle(input_bytes)
+            self._cache[input_bytes] = ciphertext
+        else:
+            self.cache_hits += 1
+        return ciphertext
+
+    def query_many(self, inputs: List[bytes]) -> List[bytes]:
+        missing = [input_bytes for input_bytes in dict.fromkeys(inputs) if input_bytes not in self._cache]
+        self.cache_hits += len(inputs) - len(missing)
+
+        if missing:
+            oracle_map = getattr(self.oracle, 'map', None)
+            ciphertexts = oracle_map(missing) if oracle_map else [self.oracle(input_bytes) for input_bytes in missing]
+            self.oracle_calls += len(missing)
+            self._cache.update(zip(missing, ciphertexts))
+
+        return [self._cache[input_bytes] for input_bytes in inputs]
+
+    def detect_block_size(self) -> Tuple[int, int]:
+        """
+            Grows the input one byte at a time until the ciphertext gets a block longer.
+            returns (block size, length of the unknown string)
+        """
+        base_len = len(self.query(b''))
+        for pad_len in itertools.count(1):
+            cipher_len = len(self.query(b'A' * pad_len))
+            if cipher_len > base_len:
+                block_size = cipher_len - base_len
+                secret_len = base_len - pad_len + (0 if self.full_block_padding else 1)
+                return block_size, secret_len
+
+    def detect_ecb(self, block_size: int) -> bool:
+        # two identical blocks in, two identical blocks out
+        return is_aes_ecb(self.query(b'A' * (block_size * 2)), block_size)
+
+    def run(self) -> bytes:
+        block_size, secret_len = self.detect_block_size()
+        if not self.detect_ecb(block_size):
+            raise ValueError('Oracle is not using ECB!')
+
+        # every target probe is needed for any secret longer than a block, so they all go out up front
+        target_ciphertexts = self.query_many([b'A' * pad_len for pad_len in range(block_size)])
+        per_query = self.candidates_per_query
+
+        known = b''
+        for position in range(secret_len):
+            pad_len = block_size - 1 - (position % block_size)
+            block_index = position // block_size
+
+            # pad + known bytes so far lines the next unknown byte up as the last byte of a block
+            target_block = target_ciphertexts[pad_len][block_index * block_size:(block_index + 1) * block_size]
+
+            # the last block_size - 1 bytes of (pad + known), followed by each possible value of the unknown byte
+            block_prefix = (b'A' * pad_len + known)[-(block_size - 1):]
+            candidates = [block_prefix + bytes([guess]) for guess in range(256)]
+            queries = [b''.join(candidates[i:i+per_query]) for i in range(0, 256, per_query)]
+            # keep just the candidate blocks of each response, the rest is the encrypted secret
+            candidates_ciphertext = b''.join(
+                ciphertext[:len(query)] for (query, ciphertext) in zip(queries, self.query_many(queries))
+            )
+
+            for guess in range(256):
+                if candidates_ciphertext[guess * block_size:(guess + 1) * block_size] == target_block:
+                    known += bytes([guess])
+                    break
+            else:
+                break # nothing matched, we've run off the end of the secret
+
+        return known
+
+def ecb_replay_attack(oracle: Callable[[bytes], bytes] = encryption_oracle) -> Tuple[bytes, ByteAtATimeEcbAttack]:
+    attack = ByteAtATimeEcbAttack(oracle)
+    return attack.run(), attack
 
 if __name__ == '__main__':
     key = b"YELLOW SUBMARINE"
-    print(encryption_oracle('a', key))
\ No newline at end of file
+    print(encryption_oracle('a', key))
+
+    with InstrumentedOracle(encryption_oracle) as oracle:
+        secret, attack = ecb_replay_attack(oracle)
+    print(secret.decode('utf8'))
+    print(f'>> recovered {len(secret)} bytes with {attack.oracle_calls} oracle calls ({attack.cache_hits} cache hits)')
+    print('>> oracle usage:', oracle.to_json(indent=4))
+    print('>> cipher context cache:', ECB_CONTEXTS.stats())
+
+    try:
+        assert secret == b64decode(UNKNOWN_STRING)
+        print('assert passed!')
+    except AssertionError:
+        print(f'FAILURE: Recovered value [{secret}] does not match the unknown string')
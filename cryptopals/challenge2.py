@@ -16,15 +16,24 @@
     746865206b696420646f6e277420706c6179
 """
 
+import importlib.util
+import json
+import os
+import platform
 import sys
+import timeit
+from typing import Callable, Dict, List, Tuple
+from profiling import profiled
+
+# numpy is optional and slow to import, so it's only imported the first time its backend is actually used
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+
+# XOR_TABLE[key][b] == b ^ key, a bytes.translate() table per single-byte key
+XOR_TABLE = [bytes([b ^ key for b in range(256)]) for key in range(256)]
 
 # ref: https://stackoverflow.com/a/29409299, encrypt2()
 # more code and not as simple as a for-loop, but apparantly much faster impl
-def fixed_xor(operand: bytes, key: bytes, byteorder=sys.byteorder):
-    # cool way to get the lengths to match
-    key = key[:len(operand)]
-    operand = operand[:len(key)]
-
+def bigint_xor(operand: bytes, key: bytes, byteorder=sys.byteorder) -> bytes:
     int_operand = int.from_bytes(operand, byteorder)
     int_key = int.from_bytes(key, byteorder)
 
@@ -32,6 +41,119 @@ def fixed_xor(operand: bytes, key: bytes, byteorder=sys.byteorder):
 
     return int_cipher.to_bytes(len(key), byteorder)
 
+def numpy_xor(operand: bytes, key: bytes, byteorder=sys.byteorder) -> bytes:
+    import numpy as np
+    # frombuffer is a view, so the only copy is the result
+    return np.bitwise_xor(np.frombuffer(operand, dtype=np.uint8), np.frombuffer(key, dtype=np.uint8)).tobytes()
+
+# translate walks the text a byte at a time through the table, past a few KB the wide backends win even after
+# building a keystream
+SINGLE_BYTE_TRANSLATE_MAX = 4096
+
+def xor_single_byte(text: bytes, key: int) -> bytes:
+    if len(text) > SINGLE_BYTE_TRANSLATE_MAX:
+        return fixed_xor(text, bytes([key]) * len(text))
+    return bytes(text).translate(XOR_TABLE[key])
+
+XOR_BACKENDS: Dict[str, Callable] = {'bigint': bigint_xor}
+if HAS_NUMPY:
+    XOR_BACKENDS['numpy'] = numpy_xor
+
+# input sizes the autotuner benchmarks, each one is the upper bound of a size bucket
+AUTOTUNE_SIZES = [16, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576]
+AUTOTUNE_BYTES = 1 << 20 # roughly how many bytes each backend xors per size
+AUTOTUNE_MAX_CALLS = 1000
+
+# force a backend instead of autotuning, ie: CRYPTOPALS_XOR_BACKEND=bigint
+BACKEND_ENV_VAR = 'CRYPTOPALS_XOR_BACKEND'
+
+_crossovers = None # list of (max size, backend name), resolved on first use
+
+def cache_dir() -> str:
+    # per-user cache for things worked out once per machine (autotuning, compiled models)
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'cryptopals')
+
+def autotune_cache_path() -> str:
+    return os.path.join(cache_dir(), 'xor_autotune.json')
+
+def autotune(sizes: List[int] = AUTOTUNE_SIZES) -> List[Tuple[int, str]]:
+    """
+        Times every available backend at each size and returns the fastest one per size bucket,
+        collapsed down to the sizes where the winner changes.
+    """
+    crossovers = []
+    for size in sizes:
+        operand = os.urandom(size)
+        key = os.urandom(size)
+        number = max(1, min(AUTOTUNE_MAX_CALLS, AUTOTUNE_BYTES // size))
+
+        timings = {
+            name: min(timeit.repeat(lambda: backend(operand, key), number=number, repeat=3))
+            for name, backend in XOR_BACKENDS.items()
+        }
+        fastest = min(timings, key=timings.get)
+
+        if crossovers and crossovers[-1][1] == fastest:
+            crossovers[-1] = (size, fastest)
+        else:
+            crossovers.append((size, fastest))
+    return crossovers
+
+def load_crossovers() -> List[Tuple[int, str]]:
+    # the result only holds for this machine + interpreter + set of backends, retune if any of those changed
+    machine = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'backends': sorted(XOR_BACKENDS),
+    }
+
+    cache_path = autotune_cache_path()
+    try:
+        with open(cache_path) as cache_file:
+            cached = json.load(cache_file)
+        if cached['machine'] == machine:
+            return [tuple(crossover) for crossover in cached['crossovers']]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    crossovers = autotune()
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as cache_file:
+            json.dump({'machine': machine, 'crossovers': crossovers}, cache_file)
+    except OSError:
+        pass # can't cache, we'll just tune again next run
+    return crossovers
+
+def resolve_crossovers() -> List[Tuple[int, str]]:
+    # a forced backend is just a single crossover covering every size, so the environment is only read once
+    forced = os.environ.get(BACKEND_ENV_VAR)
+    if forced:
+        if forced not in XOR_BACKENDS:
+            raise ValueError(f'Unknown {BACKEND_ENV_VAR} {forced!r}, expected one of: {", ".join(sorted(XOR_BACKENDS))}')
+        return [(AUTOTUNE_SIZES[-1], forced)]
+    return load_crossovers()
+
+def pick_backend(length: int) -> Callable:
+    global _crossovers
+
+    if _crossovers is None:
+        _crossovers = resolve_crossovers()
+
+    for (max_size, name) in _crossovers:
+        if length <= max_size:
+            return XOR_BACKENDS[name]
+    return XOR_BACKENDS[_crossovers[-1][1]]
+
+@profiled
+def fixed_xor(operand: bytes, key: bytes, byteorder=sys.byteorder):
+    # cool way to get the lengths to match
+    key = key[:len(operand)]
+    operand = operand[:len(key)]
+
+    return pick_backend(len(key))(operand, key, byteorder)
+
 if __name__ == "__main__":
     input_hex_str = '1c0111001f010100061a024b53535009181c'
     input_hex_key = '686974207468652062756c6c277320657965'
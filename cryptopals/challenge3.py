@@ -16,12 +16,29 @@
 
 import json
 from math import inf
-from typing import Dict
+from typing import Dict, List, Tuple
 from collections import Counter
-
+from challenge2 import XOR_TABLE, xor_single_byte
+from paths import data_path
+from profiling import profiled
+
+# what chi_squared_scoring does with each plaintext byte:
+# 0-25 = letter index (case folded), IGNORED = printable/whitespace but not a letter, INVALID = not printable
+IGNORED = 26
+INVALID = -1
+CHAR_CLASS = [
+    charcode - 65 if 65 <= charcode <= 90 else
+    charcode - 97 if 97 <= charcode <= 122 else
+    IGNORED if 32 <= charcode <= 126 or charcode in (9, 10, 13) else
+    INVALID
+    for charcode in range(256)
+]
+
+@profiled
 def single_byte_xor(text: bytes, key: int) -> bytes:
-    return bytes([b ^ key for b in text])
+    return xor_single_byte(text, key)
 
+@profiled
 def chi_squared_scoring(text: bytes, lang_freq_map: Dict) -> float:
     # ref: https://crypto.stackexchange.com/a/30259
 
@@ -45,8 +62,11 @@ def chi_squared_scoring(text: bytes, lang_freq_map: Dict) -> float:
         else:
             return inf  # not printable ASCII = impossible(?)
 
-    chi2 = 0
     text_len = len(text) - ignored
+    if text_len == 0:
+        return inf # no letters, nothing to compare
+
+    chi2 = 0
     for i in range(26):
         observed = count[i]
         expected = text_len * lang_freq_map[chr(i + 65)] # chars are uppercase in map
@@ -63,8 +83,82 @@ def score_text_as_lang(text: bytes, lang_freq_map: Dict) -> float:
     deltas = [abs(a - b) for a, b in zip(lang_freq_map.values(), text_freq_map.values())]
     return sum(deltas) / len_text
 
+# (byte, count) for every byte value that occurs, ie: the nonzero bins of the histogram
+ByteCounts = List[Tuple[int, int]]
+
+def byte_histogram(text: bytes) -> List[int]:
+    counter = Counter(text)
+    return [counter[b] for b in range(256)]
+
+def byte_counts(text: bytes) -> ByteCounts:
+    # the sparse histogram, text usually only uses a few dozen of the 256 byte values
+    return list(Counter(text).items())
+
+def chi_squared_histogram_scoring(counts: ByteCounts, key: int, lang_freq_map: Dict) -> float:
+    """
+        Same score as chi_squared_scoring(single_byte_xor(text, key)), but computed from the
+        byte_counts of the ciphertext, so the cost depends on the number of distinct bytes
+        and not on the length of the text.
+    """
+    permutation = XOR_TABLE[key]
+    count = [0 for _ in range(IGNORED + 1)]
+    total = 0
+
+    for cipher_byte, freq in counts:
+        char_class = CHAR_CLASS[permutation[cipher_byte]]
+        if char_class == INVALID:
+            return inf # not printable ASCII = impossible(?)
+        count[char_class] += freq
+        total += freq
+
+    text_len = total - count[IGNORED]
+    if text_len == 0:
+        return inf # no letters, nothing to compare
+
+    chi2 = 0
+    for i in range(26):
+        observed = count[i]
+        expected = text_len * lang_freq_map[chr(i + 65)] # chars are uppercase in map
+        difference = observed - expected
+        chi2 += difference * difference / expected
+
+    return chi2
+
+def score_text_as_lang_histogram(counts: ByteCounts, key: int, lang_freq_map: Dict) -> float:
+    permutation = XOR_TABLE[key]
+    len_text = sum(freq for (_, freq) in counts)
+
+    # counts of the plaintext are the ciphertext counts with their bytes permuted by the key
+    plain_counts = {permutation[cipher_byte]: freq for (cipher_byte, freq) in counts}
+    text_freq_map = {lang_char: (plain_counts.get(ord(lang_char), 0) * 100 / len_text) for lang_char in lang_freq_map}
+    deltas = [abs(a - b) for a, b in zip(lang_freq_map.values(), text_freq_map.values())]
+    return sum(deltas) / len_text
+
+# text scoring fn -> equivalent fn that scores a key straight from the ciphertext byte_counts
+HISTOGRAM_SCORERS = {
+    chi_squared_scoring: chi_squared_histogram_scoring,
+    score_text_as_lang: score_text_as_lang_histogram,
+}
+
+def score_all_keys(cipher_bytes: bytes, lang_freq_map: Dict, histogram_score_fn=chi_squared_histogram_scoring) -> List[float]:
+    # one pass over the ciphertext, then every key is scored off the same nonzero bins
+    counts = byte_counts(cipher_bytes)
+    return [histogram_score_fn(counts, key, lang_freq_map) for key in range(256)]
+
+@profiled
 def char_freq_xor_decode(cipher_bytes: bytes, lang_freq_map: Dict, encoding, score_fn):
-    
+    histogram_score_fn = HISTOGRAM_SCORERS.get(score_fn)
+    if histogram_score_fn is not None:
+        scores = score_all_keys(cipher_bytes, lang_freq_map, histogram_score_fn)
+        best_score = min(scores)
+        if best_score == inf:
+            return (inf, None, None)
+
+        # only the winning key gets its plaintext built
+        key = scores.index(best_score)
+        return (best_score, single_byte_xor(cipher_bytes, key).decode(encoding), chr(key))
+
+    # arbitrary scoring fn, fall back to decoding every candidate
     optimal = (inf, None, None)
 
     for key in range(256):
@@ -77,7 +171,7 @@ def char_freq_xor_decode(cipher_bytes: bytes, lang_freq_map: Dict, encoding, sco
     return optimal
 
 if __name__ == "__main__":
-    with open('./english_language_charachter_frequencies.json') as lang_freq_file:    
+    with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file:    
         input_hex_str = '1b37373331363f78151b7f2b783431333d78397828372d363c78373e783a393b3736'
         lang_freq_map = json.load(lang_freq_file)
         
@@ -8,29 +8,167 @@
     (Your code from #3 should help.)
 """
 
+import heapq
+import itertools
 import json
+import sys
+import time
+from functools import partial
 from math import inf
+from typing import Callable, Dict, Iterable, Iterator, List, TextIO, Tuple, TypeVar
 from challenge3 import char_freq_xor_decode, chi_squared_scoring, score_text_as_lang
+from paths import data_path
+
+def iter_hex_lines(data_file: TextIO) -> Iterator[Tuple[int, str]]:
+    # streams (line number, hex string) pairs, works the same for big files and pipes
+    for line_number, line in enumerate(data_file, start=1):
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+def batched(iterable: Iterable, batch_size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+BatchResult = TypeVar('BatchResult')
+
+def map_batches(fn: Callable[[List], BatchResult], batches: Iterable[List], processes: int = None) -> Iterator[BatchResult]:
+    """
+        Yields fn(batch) for every batch, in order. processes > 1 fans the batches out to a process pool
+        (fn has to pickle), anything else runs them here one after the other.
+    """
+    if processes is not None and processes > 1:
+        from concurrent.futures import ProcessPoolExecutor # only paid for when a pool is used
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # only keep a couple of batches per worker in flight so we never read the whole input ahead
+            max_pending = processes * 2
+            pending = []
+            for batch in batches:
+                pending.append(executor.submit(fn, batch))
+                if len(pending) >= max_pending:
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+    else:
+        for batch in batches:
+            yield fn(batch)
+
+def score_batch(batch: List[Tuple[int, str]], lang_freq_map: Dict, score_fn=chi_squared_scoring) -> Tuple[int, int, List[Tuple]]:
+    # module level so it can be shipped to worker processes. returns (lines, lines that weren't hex, results)
+    results = []
+    skipped = 0
+    for line_number, hex_str in batch:
+        try:
+            cipher_bytes = bytes.fromhex(hex_str)
+        except ValueError:
+            skipped += 1 # one bad line shouldn't end the scan
+            continue
+        (score, text, key_char) = char_freq_xor_decode(cipher_bytes, lang_freq_map, 'utf8', score_fn)
+        if score is not inf:
+            results.append((score, text, key_char, line_number))
+    return len(batch), skipped, results
+
+def detect_single_byte_xor(data_file: TextIO, lang_freq_map: Dict, top_k: int = 10, batch_size: int = 1024, processes: int = None, score_fn=chi_squared_scoring):
+    """
+        Streams hex lines from data_file and keeps the top_k lowest scoring (score, text, key, line number)
+        results in a bounded heap, so memory use doesn't grow with the size of the input.
+        processes > 1 fans the batches out to a process pool. Lines that aren't valid hex are skipped and
+        counted in stats['skipped'].
+
+        returns (results sorted by score ascending, stats dict)
+    """
+    if top_k < 1:
+        raise ValueError('top_k must be at least 1!')
+
+    # max-heap of the best results so far, by negated score. line number breaks ties so earlier lines win
+    heap = []
+    lines = 0
+    skipped = 0
+    start = time.perf_counter()
+
+    def keep(batch_result):
+        nonlocal lines, skipped
+        (batch_lines, batch_skipped, results) = batch_result
+        lines += batch_lines
+        skipped += batch_skipped
+        for (score, text, key_char, line_number) in results:
+            item = (-score, -line_number, text, key_char)
+            if len(heap) < top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    batches = batched(iter_hex_lines(data_file), batch_size)
+    batch_fn = partial(score_batch, lang_freq_map=lang_freq_map, score_fn=score_fn)
+
+    for batch_result in map_batches(batch_fn, batches, processes):
+        keep(batch_result)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'lines': lines,
+        'skipped': skipped,
+        'seconds': elapsed,
+        'lines_per_sec': lines / elapsed if elapsed > 0 else inf,
+    }
+
+    results = [(-neg_score, text, key_char, -neg_line_number) for (neg_score, neg_line_number, text, key_char) in heap]
+    results.sort(key=lambda tup: (tup[0], tup[3]))
+    return results, stats
 
 if __name__ == "__main__":
-    with open('./english_language_charachter_frequencies.json') as lang_freq_file, open('./4.txt', 'rt') as data_file:    
+    # usage: python challenge4.py [path to hex lines, or - for stdin] [top k]
+    path = sys.argv[1] if len(sys.argv) > 1 else data_path('4.txt')
+    top_k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file:
         lang_freq_map = json.load(lang_freq_file)
 
-        decode_fn = lambda hex_str: char_freq_xor_decode(bytes.fromhex(hex_str.strip()), lang_freq_map, 'utf8', chi_squared_scoring)
-        results = [decode_fn(line) for line in data_file.readlines()]
-        results = [r for r in results if r[0] is not inf]
-        optimal_result = sorted(results, key=lambda tup: tup[0])
+    data_file = sys.stdin if path == '-' else open(path, 'rt')
+    with data_file:
+        optimal_result, stats = detect_single_byte_xor(data_file, lang_freq_map, top_k)
         print(optimal_result)
+        print(f">> scanned {stats['lines']} lines at {stats['lines_per_sec']:.0f} lines/sec")
+        if stats['skipped']:
+            print(f">> skipped {stats['skipped']} lines that weren't hex")
         """
         the result is:
         [
-            (27.396093820508746, 'R4^Ho+[7tRO_dV)84fi##[R3LihkwG', 'e'), 
-            (40.296519805563, 'Now that the party is jumping\n', '5'), // not the lowest score, but more likely to be correct
-            (43.99218123708534, 'Ok*DOs8BiKeL8_guI_ro/y#Y|<3A[F', 'p'), 
-            (45.051354672599096, '_ HvHm?lw@fr%1$n KeAbC9:vO@h9W', 'i'), 
-            (79.42882070229494, 'qvSu}ahhu&@>d+gR4,|TGn}Al8~sCB', 'd'), 
-            (92.76933967723427, 'kwb%gpl,$lXgO.OhV\t8DF|k7)M{GoN', 's'), 
-            (294.7439151983607, ']$4OFs>\\YQ#\nK9y?IT4PeNWTxFqc0\r', 'g'), 
-            (1180.1550432083654, 'Zf/[Xi{kczx%Gkxr]bd@(rw\rkGQKzx', 't')
+            (27.396093820508746, 'R4^Ho+[7tRO_dV)84fi##[R3LihkwG', 'e', 226), 
+            (40.296519805563, 'Now that the party is jumping\n', '5', 171), // not the lowest score, but more likely to be correct
+            (43.99218123708534, 'Ok*DOs8BiKeL8_guI_ro/y#Y|<3A[F', 'p', 196), 
+            (45.051354672599096, '_ HvHm?lw@fr%1$n KeAbC9:vO@h9W', 'i', 296), 
+            (79.42882070229494, 'qvSu}ahhu&@>d+gR4,|TGn}Al8~sCB', 'd', 231), 
+            (92.76933967723427, 'kwb%gpl,$lXgO.OhV\t8DF|k7)M{GoN', 's', 36), 
+            (294.7439151983607, ']$4OFs>\\YQ#\nK9y?IT4PeNWTxFqc0\r', 'g', 150), 
+            (1180.1550432083654, 'Zf/[Xi{kczx%Gkxr]bd@(rw\rkGQKzx', 't', 290)
         ]
         """
+
+    if len(sys.argv) == 1:
+        # letter frequencies can't see that '^' and '#' aren't english, the ngram model ranks the real line first
+        from ngram_model import load_model, ngram_scoring
+        with open(path, 'rt') as data_file:
+            ngram_result, _ = detect_single_byte_xor(data_file, load_model(), top_k, score_fn=ngram_scoring)
+        (_, text, key_char, line_number) = ngram_result[0]
+        assert (text, line_number) == ('Now that the party is jumping\n', 171)
+        print(f'>> ngram model: line {line_number} {text!r} with key {key_char!r}')
+
+        # a line that isn't hex is skipped and counted, the rest of the scan goes on
+        import io
+        with open(path, 'rt') as data_file:
+            lines = data_file.readlines()
+        lines.insert(3, 'not hex at all\n')
+        (bad_line_result, stats) = detect_single_byte_xor(io.StringIO(''.join(lines)), lang_freq_map, top_k)
+        assert stats['skipped'] == 1 and stats['lines'] == len(lines)
+        assert [text for (_, text, _, _) in bad_line_result] == [text for (_, text, _, _) in optimal_result]
+
+        try:
+            detect_single_byte_xor(io.StringIO(''.join(lines)), lang_freq_map, top_k=0)
+            assert False, 'expected a ValueError'
+        except ValueError:
+            pass
@@ -18,13 +18,28 @@
     Encrypt a bunch of stuff using your repeating-key XOR function. Encrypt your mail. Encrypt your password file. Your .sig file. Get a feel for it. I promise, we aren't wasting your time with this.
 """
 
-from challenge2 import fixed_xor
+import mmap
+import sys
+from typing import BinaryIO, Iterable, Iterator, Union
+from challenge2 import fixed_xor, xor_single_byte
+from profiling import profiled
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+ByteSource = Union[bytes, bytearray, memoryview, mmap.mmap, BinaryIO, Iterable[bytes]]
 
 # ref: https://stackoverflow.com/a/3391106
 def repeat_to_length(s: bytes, wanted: int) -> bytes:
     return (s * (wanted//len(s) + 1))[:wanted]
 
+@profiled
 def text_xor(text: bytes, key: bytes) -> bytes:
+    if not key:
+        raise ValueError('Key must not be empty!')
+    if len(key) == 1:
+        # no keystream to build for short texts
+        return xor_single_byte(text, key[0])
+
     repeated_key = None
     len_key = len(key)
     len_text = len(text)
@@ -38,9 +53,73 @@ def text_xor(text: bytes, key: bytes) -> bytes:
 
     # return bytes([ x^y for (x,y) in zip(repeated_key, text)])
     return fixed_xor(text, repeated_key)
-    
+
+def iter_chunks(source: ByteSource, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[memoryview]:
+    """
+        Yields the contents of source as chunks of at most chunk_size bytes.
+        File objects are read into one reused buffer, so each chunk is only valid until the next one is requested.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        view = memoryview(source)
+        for i in range(0, len(view), chunk_size):
+            yield view[i:i+chunk_size]
+    elif hasattr(source, 'readinto'):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            num_read = source.readinto(buffer)
+            if not num_read:
+                return
+            yield view[:num_read]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield memoryview(chunk)
+    else:
+        for chunk in source:
+            view = memoryview(chunk)
+            for i in range(0, len(view), chunk_size):
+                yield view[i:i+chunk_size]
+
+def stream_text_xor(source: ByteSource, key: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[memoryview]:
+    """
+        Repeating-key xor over source in chunk_size pieces, keeping track of where in the key each chunk starts.
+        Output goes into one reused buffer, so each yielded chunk has to be consumed (written, copied) before the
+        next one is requested. Memory use is bounded by chunk_size no matter how big the input is.
+    """
+    len_key = len(key)
+    if not len_key:
+        raise ValueError('Key must not be empty!')
+
+    # long enough to slice a full chunk out of, starting at any key offset
+    keystream = memoryview(repeat_to_length(key, chunk_size + len_key))
+    out_buffer = bytearray(chunk_size)
+    out_view = memoryview(out_buffer)
+
+    key_offset = 0
+    for chunk in iter_chunks(source, chunk_size):
+        len_chunk = len(chunk)
+        out_view[:len_chunk] = fixed_xor(chunk, keystream[key_offset:key_offset+len_chunk])
+        yield out_view[:len_chunk]
+        key_offset = (key_offset + len_chunk) % len_key
+
+def text_xor_file(source: ByteSource, dest: BinaryIO, key: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    # xor is its own inverse, so this both encrypts and decrypts
+    total = 0
+    for chunk in stream_text_xor(source, key, chunk_size):
+        dest.write(chunk)
+        total += len(chunk)
+    return total
+
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # usage: python challenge5.py KEY < infile > outfile
+        text_xor_file(sys.stdin.buffer, sys.stdout.buffer, sys.argv[1].encode('utf8'))
+        sys.exit(0)
+
     input_text = "Burning 'em, if you ain't quick and nimble\nI go crazy when I hear a cymbal".encode('utf8')
     input_key = 'ICE'.encode('utf8')
 
@@ -53,3 +132,24 @@ if __name__ == "__main__":
         print('assert passed!')
     except AssertionError:
         print(f'FAILURE: Actual value [{actual}] does not match expected value [{expected}]')
+
+    # chunks smaller than the key and not a multiple of it, so the key offset has to carry across chunks
+    streamed = b''.join(bytes(chunk) for chunk in stream_text_xor(iter([input_text[:10], input_text[10:]]), input_key, chunk_size=4))
+    streamed = bytes.hex(streamed)
+
+    try:
+        assert streamed == expected
+        print('streaming assert passed!')
+    except AssertionError:
+        print(f'FAILURE: Streamed value [{streamed}] does not match expected value [{expected}]')
+
+    rejected = True
+    for xor_fn in (text_xor, lambda text, key: b''.join(stream_text_xor(text, key))):
+        try:
+            xor_fn(input_text, b'')
+            rejected = False
+            print('FAILURE: an empty key was accepted')
+        except ValueError:
+            pass
+    if rejected:
+        print('empty key assert passed!')
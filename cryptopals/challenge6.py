@@ -30,11 +30,17 @@
     This code is going to turn out to be surprisingly useful later on. Breaking repeating-key XOR ("Vigenere") statistically is obviously an academic exercise, a "Crypto 101" thing. But more people "know how" to break it than can actually break it, and a similar technique breaks something much more important. 
 """
 import base64
-import itertools
 import json
-from typing import Iterable
-from challenge3 import char_freq_xor_decode, chi_squared_scoring
+import os
+from functools import partial
+from math import inf
+from typing import Dict, Iterable, List, Tuple
+from blocks import BlockView
+from challenge3 import byte_counts, char_freq_xor_decode, chi_squared_histogram_scoring, chi_squared_scoring
 from challenge5 import text_xor
+from ngram_model import load_model, ngram_scoring
+from paths import data_path
+from profiling import profiled
 
 def bits(n):
     """
@@ -48,19 +54,18 @@ def bits(n):
         yield b
         n ^= b
 
+@profiled
 def hamming_distance(src_bytes: bytes, target_bytes: bytes) -> int: 
     # ref: https://en.wikipedia.org/wiki/Hamming_distance, https://www.hacksparrow.com/comp-sci/what/hamming-distance.html
     if len(src_bytes) != len(target_bytes):
         # raise 'Lengths must match!'
         return 0
-    
-    distance = 0
-    for byte1, byte2 in zip(src_bytes, target_bytes):
-        xor_val = byte1 ^ byte2
-        hamming_weight = len(list(bits(xor_val))) # the number of nonzero bits in the xor val 
-        distance += hamming_weight
-    return distance
 
+    # xor the two buffers as big ints and popcount the result in one go
+    xor_val = int.from_bytes(src_bytes, 'big') ^ int.from_bytes(target_bytes, 'big')
+    return xor_val.bit_count() # the number of nonzero bits in the xor val
+
+@profiled
 def chunk_text(text: Iterable, chunk_size: int):
     # ref: https://stackoverflow.com/a/23384110
     text_len = len(text)
@@ -72,58 +77,129 @@ def chunk_text(text: Iterable, chunk_size: int):
     return chunks
 
 def score_keysize(ciphertext: bytes, keysize: int) -> float:
-    cipher_chunks = chunk_text(ciphertext, keysize)
-    
-    blocks = [
-        cipher_chunks[0],
-        cipher_chunks[1]
-    ]
+    """
+        Average normalized hamming distance between each of the first two KEYSIZE blocks and every block
+        of the ciphertext (a trailing partial block counts as distance 0).
 
-    distances = [
-        [hamming_distance(block, chunk) for chunk in cipher_chunks]
-        for block in blocks
-    ]
+        Rather than calling hamming_distance once per block, each of the two blocks is tiled across all the
+        full blocks and xor'd against the ciphertext in one go, so the work per keysize is a couple of
+        big-int operations no matter how long the ciphertext is.
+    """
+    if len(ciphertext) < 2 * keysize:
+        # fewer than two full blocks leaves nothing to compare, a lone block would tile to a distance of 0
+        return inf
 
-    avg = (sum(distances[0]) + sum(distances[1])) / (len(cipher_chunks) * 2)
+    num_chunks = -(-len(ciphertext) // keysize) # ceil
+    full_len = (len(ciphertext) // keysize) * keysize
+    full_blocks = ciphertext[:full_len]
+
+    total_distance = 0
+    for block_index in range(2):
+        block = ciphertext[block_index * keysize:(block_index + 1) * keysize]
+        if len(block) == keysize:
+            total_distance += hamming_distance(block * (full_len // keysize), full_blocks)
+
+    avg = total_distance / (num_chunks * 2)
     return avg / keysize # normalize score
 
-def guess_keysize(ciphertext: bytes, min_keysize=2, max_keysize=40): 
+def score_keysizes(ciphertext: bytes, min_keysize=2, max_keysize=40) -> List[Tuple[int, float]]:
     keysize_scores = [] # list of (keysize, hamming distance)
     for keysize in range(min_keysize, max_keysize):
         avg_distance = score_keysize(ciphertext, keysize)
-        keysize_scores.append((keysize, avg_distance, ))
-        
+        # keysizes the ciphertext is too short for are left out, an empty ciphertext has none at all
+        if avg_distance != inf:
+            keysize_scores.append((keysize, avg_distance, ))
+
     # sort the keysizes by their distance score ascending 
     keysize_scores.sort(key=lambda d: d[1])
 
-    return keysize_scores[0]
+    return keysize_scores
 
-def decode_multi_byte_xor(ciphertext: bytes, keysize: int, lang_freq_map):
-    chunks = chunk_text(ciphertext, keysize) # chunks of byte strings
-    # we could also probably use numpy/pandas here
-    # ref: https://stackoverflow.com/a/6473724
-    
-    transposed = list(itertools.zip_longest(*chunks, fillvalue=None)) # list of tuples of chars
+def guess_keysize(ciphertext: bytes, min_keysize=2, max_keysize=40): 
+    keysize_scores = score_keysizes(ciphertext, min_keysize, max_keysize)
+    if not keysize_scores:
+        raise ValueError('Ciphertext is too short to guess a keysize!')
+    return keysize_scores[0]
 
-    text_cols = []
+def decode_multi_byte_xor(ciphertext: bytes, keysize: int, lang_freq_map, score_fn=chi_squared_scoring):
+    # column i of the transposed blocks is just every keysize-th byte starting at i
+    text_cols = [''] * len(ciphertext)
     complete_key = ''
-    for col in transposed:
-        # join each column into a string for processing
-        col_bytes = bytes([b for b in col if b is not None])
-        # process bytes
-        (_, col_text, key_char) = char_freq_xor_decode(col_bytes, lang_freq_map, 'utf8', chi_squared_scoring)
+    blocks = BlockView(ciphertext, keysize)
+    for i in range(keysize):
+        col_bytes = bytes(blocks.column(i))
+        (_, col_text, key_char) = char_freq_xor_decode(col_bytes, lang_freq_map, 'utf8', score_fn)
 
         if key_char is not None:
-            text_cols.append(col_text)
+            # put the decoded column back in its original positions
+            text_cols[i::keysize] = col_text
             complete_key += key_char
 
-    plaintext = ''.join([''.join(items) for items in zip(*text_cols)])
+    plaintext = ''.join(text_cols)
     return (plaintext, complete_key, )
 
-def viginere_decode(ciphertext: bytes, lang_freq_map):
-    (keysize, _) = guess_keysize(ciphertext)
-    print('>> keysize guess:', keysize)
-    return decode_multi_byte_xor(ciphertext, keysize, lang_freq_map)
+def solve_column(column_task: Tuple[int, int, bytes], lang_freq_map: Dict, score_fn=chi_squared_scoring):
+    # module level so it can be shipped to worker processes
+    (keysize, col_index, col_bytes) = column_task
+    (_, _, key_char) = char_freq_xor_decode(col_bytes, lang_freq_map, 'utf8', score_fn)
+    return keysize, col_index, key_char
+
+def solve_vigenere(ciphertext: bytes, lang_freq_map: Dict, top_n: int = 3, processes: int = None, score_fn=chi_squared_scoring) -> List[Tuple[str, str, float]]:
+    """
+        Solves the top_n most likely keysizes instead of committing to the best one. Every column of every
+        candidate keysize is an independent single-byte xor problem, so they are all solved together.
+        processes > 1 spreads them across a process pool, by default they are solved in this process.
+
+        lang_freq_map is whatever score_fn takes (the letter frequency map, or an ngram_model.NgramModel)
+
+        returns a list of (key, plaintext, score) ranked by score_fn over the whole plaintext,
+        candidates with an unsolvable column are dropped
+    """
+    keysizes = [keysize for (keysize, _) in score_keysizes(ciphertext)[:top_n]]
+    column_tasks = [
+        (keysize, i, bytes(column))
+        for keysize in keysizes
+        for (i, column) in enumerate(BlockView(ciphertext, keysize).columns())
+    ]
+
+    column_fn = partial(solve_column, lang_freq_map=lang_freq_map, score_fn=score_fn)
+    if processes is not None and processes > 1:
+        from concurrent.futures import ProcessPoolExecutor # only paid for when a pool is used
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chunksize = max(1, len(column_tasks) // (processes * 4))
+            solved = list(executor.map(column_fn, column_tasks, chunksize=chunksize))
+    else:
+        solved = [column_fn(task) for task in column_tasks]
+
+    keys = {keysize: [None] * keysize for keysize in keysizes}
+    for (keysize, col_index, key_char) in solved:
+        keys[keysize][col_index] = key_char
+
+    candidates = []
+    for keysize in keysizes:
+        if None in keys[keysize]:
+            continue
+        key = ''.join(keys[keysize])
+        plaintext_bytes = text_xor(ciphertext, key.encode('latin1'))
+        if score_fn is chi_squared_scoring:
+            # key 0 leaves the counts as they are, so this is the same score without walking the plaintext byte by byte
+            score = chi_squared_histogram_scoring(byte_counts(plaintext_bytes), 0, lang_freq_map)
+        else:
+            score = score_fn(plaintext_bytes, lang_freq_map)
+        if score is not inf:
+            candidates.append((key, plaintext_bytes.decode('utf8'), score))
+
+    candidates.sort(key=lambda candidate: candidate[2])
+    return candidates
+
+def viginere_decode(ciphertext: bytes, lang_freq_map, top_n: int = 1, processes: int = 1, score_fn=chi_squared_scoring):
+    candidates = solve_vigenere(ciphertext, lang_freq_map, top_n, processes, score_fn)
+    if not candidates:
+        return ('', '', )
+
+    (complete_key, plaintext, _) = candidates[0]
+    print('>> keysize guess:', len(complete_key))
+    return (plaintext, complete_key, )
 
 class Tests:
     def get_gettysberg_address():
@@ -197,7 +273,7 @@ class Tests:
 """
 
 if __name__ == "__main__":
-    with open('./cryptopals/set1/english_language_charachter_frequencies.json') as lang_freq_file, open('./cryptopals/set1/6.txt', 'rt') as data_file:    
+    with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file, open(data_path('6.txt'), 'rt') as data_file:    
         lang_freq_map = json.load(lang_freq_file)
         
         encoded_text = data_file.read().strip()
@@ -206,11 +282,10 @@ if __name__ == "__main__":
         print('--------- running tests ---------')
         Tests.test_hamming_distance()
         Tests.test_decode_multi_byte_xor_key_even_factor(lang_freq_map)
-        
-        # TODO: fix this test. likely related to the bug in final output
-        # Tests.test_decode_multi_byte_xor_key_not_even_factor(lang_freq_map) 
+        Tests.test_decode_multi_byte_xor_key_not_even_factor(lang_freq_map) 
         print('--------- tests complete ---------')
 
-        (plaintext, complete_key, ) = viginere_decode(encoded_text, lang_freq_map)
-        print(f'>> complete xor key: [{complete_key}]') # "Terminator X: Bring the ioise".. "ioise" should probably be "noise"
+        # letter frequencies alone give "Terminator X: Bring the ioise", the byte level ngram model gets "noise"
+        (plaintext, complete_key, ) = viginere_decode(encoded_text, load_model(), top_n=3, processes=os.cpu_count(), score_fn=ngram_scoring)
+        print(f'>> complete xor key: [{complete_key}]') # "Terminator X: Bring the noise"
         # print(plaintext)
@@ -9,34 +9,205 @@
 
     Easiest way: use OpenSSL::Cipher and give it AES-128-ECB as the cipher. 
 """
-import base64
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import BinaryIO, Dict, List, Literal
 
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-
-from challenge6 import chunk_text
+from challenge5 import DEFAULT_CHUNK_SIZE, ByteSource, iter_chunks
 from challenge9 import pkcs7_padding
+from paths import data_path
+from pipeline import b64_decode, ecb_decrypt, pkcs7_unpad, run_pipeline, utf8_decode
+from profiling import profiled
+
+AES_BLOCK_SIZE = 16
+
+
+def aes_ecb_cipher(key: bytes):
+    # cryptography is slow to import, so it's only pulled in once a cipher is actually needed
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    return Cipher(algorithms.AES(key), mode=modes.ECB())
+
+class CipherContextCache:
+    """
+        LRU cache of initialized AES-ECB encryptor/decryptor contexts keyed by (key, mode), so an oracle
+        that encrypts under the same key over and over only runs the key schedule once.
+
+        An ECB context that's only ever given whole blocks and never finalized holds no state between
+        update() calls, which is what makes sharing one safe. Anything that needs a partial block carried
+        over or finalize() (AesEcbStream) has to make its own context.
+
+        cryptography's contexts can't be used from two threads at once, so every thread gets its own
+        entries, and its own hit/miss/eviction counters so they're never updated from two threads either.
+        hits, misses and evictions add up the counters of every thread.
+
+        A key that's only used once (challenge11's random key oracle) only adds misses and evictions, it's
+        better off with its own context from aes_ecb_cipher.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._local = threading.local()
+        # [hits, misses, evictions] of every thread that has used the cache, only appended to under the lock
+        self._thread_counts: List[List[int]] = []
+        self._lock = threading.Lock()
+
+    def _contexts(self) -> OrderedDict:
+        contexts = getattr(self._local, 'contexts', None)
+        if contexts is None:
+            contexts = self._local.contexts = OrderedDict()
+            counts = self._local.counts = [0, 0, 0]
+            with self._lock:
+                self._thread_counts.append(counts)
+        return contexts
+
+    def _total(self, index: int) -> int:
+        with self._lock:
+            return sum(counts[index] for counts in self._thread_counts)
+
+    @property
+    def hits(self) -> int:
+        return self._total(0)
+
+    @property
+    def misses(self) -> int:
+        return self._total(1)
+
+    @property
+    def evictions(self) -> int:
+        return self._total(2)
+
+    def get(self, key: bytes, mode: Literal["encrypt", "decrypt"]):
+        contexts = self._contexts()
+        counts = self._local.counts
+        cache_key = (bytes(key), mode)
+
+        context = contexts.get(cache_key)
+        if context is not None:
+            counts[0] += 1
+            contexts.move_to_end(cache_key)
+            return context
+
+        counts[1] += 1
+        cipher = aes_ecb_cipher(key)
+        if mode == 'encrypt':
+            context = cipher.encryptor()
+        elif mode == 'decrypt':
+            context = cipher.decryptor()
+        else:
+            raise ValueError('Invalid mode!')
+
+        contexts[cache_key] = context
+        if len(contexts) > self.maxsize:
+            contexts.popitem(last=False)
+            counts[2] += 1
+        return context
+
+    def clear(self):
+        # this thread's entries, and every thread's counters
+        self._contexts().clear()
+        with self._lock:
+            for counts in self._thread_counts:
+                counts[:] = [0, 0, 0]
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._contexts()), 'maxsize': self.maxsize}
 
+ECB_CONTEXTS = CipherContextCache()
 
-def encrypt_aes_ecb(plaintext: bytes, key: bytes) -> bytes:
-    algorithm = algorithms.AES(key)
-    cipher = Cipher(algorithm, mode=modes.ECB())
-    encryptor = cipher.encryptor()
+def aes_ecb_context(key: bytes, mode: Literal["encrypt", "decrypt"]):
+    # shared context from ECB_CONTEXTS: whole blocks only, and never call finalize() on it
+    return ECB_CONTEXTS.get(key, mode)
 
-    block_size = len(key)
-    plain_chunks = chunk_text(plaintext, block_size)
-    cipher_chunks = [encryptor.update(pkcs7_padding(chunk, block_size)) for chunk in plain_chunks]
 
-    return b''.join(cipher_chunks)
+class AesEcbStream:
+    """
+        Incremental AES-ECB. update() hands whatever it's given to OpenSSL in one call and writes the
+        output into a reused buffer, the cipher context itself holds on to any partial block between calls.
+        When encrypting, only the final partial block gets padded, in finalize(). full_block_padding=True is
+        standard PKCS#7 instead, block aligned input gets a whole block of padding.
 
+        The memoryview returned by update() is only valid until the next call.
+    """
+
+    def __init__(self, key: bytes, mode: Literal["encrypt", "decrypt"], chunk_size: int = DEFAULT_CHUNK_SIZE, full_block_padding: bool = False):
+        cipher = aes_ecb_cipher(key)
+
+        if mode == 'encrypt':
+            self._context = cipher.encryptor()
+        elif mode == 'decrypt':
+            self._context = cipher.decryptor()
+        else:
+            raise ValueError('Invalid mode!')
+
+        self.mode = mode
+        self.full_block_padding = full_block_padding
+        self._total_len = 0
+        self._buffer = bytearray(chunk_size + AES_BLOCK_SIZE - 1)
+
+    def update(self, data: bytes) -> memoryview:
+        # update_into needs room for a block's worth of previously buffered input on top of data
+        needed = len(data) + AES_BLOCK_SIZE - 1
+        if len(self._buffer) < needed:
+            self._buffer = bytearray(needed)
+
+        self._total_len += len(data)
+        num_written = self._context.update_into(data, self._buffer)
+        return memoryview(self._buffer)[:num_written]
+
+    def finalize(self) -> bytes:
+        result = b''
+        remainder_len = self._total_len % AES_BLOCK_SIZE
+
+        if self.mode == 'encrypt' and (remainder_len or self.full_block_padding):
+            # the context is holding the last partial block, feeding it the pad bytes completes it
+            result = self._context.update(pkcs7_padding(b'', AES_BLOCK_SIZE - remainder_len))
+
+        # raises ValueError if a decrypt stream was left with a partial block
+        return result + self._context.finalize()
+
+# below this, copying the plaintext to pad it costs less than a second call into OpenSSL
+ECB_PAD_COPY_MAX = 16384
+
+@profiled
+def encrypt_aes_ecb(plaintext: bytes, key: bytes, cached: bool = True) -> bytes:
+    # only a trailing partial block gets padded, so the shared context only ever sees whole blocks.
+    # cached=False is for keys that are only used once, they'd just churn the shared cache
+    context = aes_ecb_context(key, 'encrypt') if cached else aes_ecb_cipher(key).encryptor()
+    remainder_len = len(plaintext) % AES_BLOCK_SIZE
+    if not remainder_len:
+        return context.update(plaintext)
+
+    padding = pkcs7_padding(b'', AES_BLOCK_SIZE - remainder_len)
+    if len(plaintext) <= ECB_PAD_COPY_MAX:
+        return context.update(bytes(plaintext) + padding)
+
+    # the aligned prefix goes straight from the caller's buffer, only the last block is copied to be padded
+    full_len = len(plaintext) - remainder_len
+    last_block = bytes(plaintext[full_len:]) + padding
+    buffer = bytearray(full_len + 2 * AES_BLOCK_SIZE - 1) # update_into wants a block's worth of slack
+    num_written = context.update_into(memoryview(plaintext)[:full_len], buffer)
+    num_written += context.update_into(last_block, memoryview(buffer)[num_written:])
+    return bytes(memoryview(buffer)[:num_written])
+
+@profiled
 def decrypt_aes_ecb(ciphertext: bytes, key: bytes) -> bytes:
-    algorithm = algorithms.AES(key)
-    cipher = Cipher(algorithm, mode=modes.ECB())
-    decryptor = cipher.decryptor()
+    if len(ciphertext) % AES_BLOCK_SIZE:
+        raise ValueError('Ciphertext length must be a multiple of the block size!')
+    return aes_ecb_context(key, 'decrypt').update(ciphertext)
 
-    cipher_chunks = chunk_text(ciphertext, len(key))
-    plain_chunks = [decryptor.update(chunk) for chunk in cipher_chunks]
+def aes_ecb_file(source: ByteSource, dest: BinaryIO, key: bytes, mode: Literal["encrypt", "decrypt"], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    stream = AesEcbStream(key, mode, chunk_size)
 
-    return b''.join(plain_chunks)
+    total = 0
+    for chunk in iter_chunks(source, chunk_size):
+        result = stream.update(chunk)
+        dest.write(result)
+        total += len(result)
+
+    result = stream.finalize()
+    dest.write(result)
+    return total + len(result)
 
 class Tests:
     def get_gettysberg_address():
@@ -66,16 +237,32 @@ class Tests:
 
 if __name__ == "__main__":
     Tests.test_ecb()
-    
-    with open('./7.txt', 'rt') as data_file:    
-        encoded_text = data_file.read().strip()
-        ciphertext = base64.b64decode(encoded_text)
 
+    # the second round trip under the same key reuses both contexts
+    ECB_CONTEXTS.clear()
+    for _ in range(2):
+        assert decrypt_aes_ecb(encrypt_aes_ecb(b'YELLOW SUBMARINE!', b'YELLOW SUBMARINE'), b'YELLOW SUBMARINE') == b'YELLOW SUBMARINE!' + b'\x0f' * 15
+    assert (ECB_CONTEXTS.hits, ECB_CONTEXTS.misses) == (2, 2)
+
+    # every thread counts for itself, so nothing is lost when they all hammer the cache at once
+    from concurrent.futures import ThreadPoolExecutor
+    ECB_CONTEXTS.clear()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: encrypt_aes_ecb(b'YELLOW SUBMARINE', b'YELLOW SUBMARINE'), range(8000)))
+    assert ECB_CONTEXTS.hits + ECB_CONTEXTS.misses == 8000
+
+    # a one off key doesn't touch the cache at all
+    ECB_CONTEXTS.clear()
+    assert encrypt_aes_ecb(b'YELLOW SUBMARINE!', b'0123456789abcdef', cached=False) == encrypt_aes_ecb(b'YELLOW SUBMARINE!', b'0123456789abcdef')
+    assert (ECB_CONTEXTS.hits, ECB_CONTEXTS.misses) == (0, 1)
+    
+    with open(data_path('7.txt'), 'rb') as data_file:    
         key = "YELLOW SUBMARINE"
         key = bytes(key, 'utf8')
-        
-        plaintext_bytes = decrypt_aes_ecb(ciphertext, key)
-        plaintext = plaintext_bytes.decode('utf8')
+
+        # base64 -> ECB -> unpad -> text, a chunk at a time
+        plaintext = run_pipeline(data_file, b64_decode, partial(ecb_decrypt, key=key), pkcs7_unpad, utf8_decode)
 
         print("plaintext: ")
-        print(plaintext)
+        for text in plaintext:
+            print(text, end='')
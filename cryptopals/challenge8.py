@@ -10,15 +10,72 @@
     Remember that the problem with ECB is that it is stateless and deterministic; the same 16 byte plaintext block will always produce the same 16 byte ciphertext.
 """
 import binascii
+import sys
 from collections import Counter
-from challenge6 import chunk_text
+from functools import partial
+from typing import BinaryIO, Dict, Iterator, List, TextIO, Tuple, Union
+from blocks import BlockView
+from challenge4 import batched, map_batches
+from paths import data_path
+
+def iter_blocks(ciphertext: bytes, keysize: int = 16) -> Iterator[memoryview]:
+    # memoryviews over read-only bytes hash and compare like the bytes themselves, without copying each block.
+    # a trailing partial block can't repeat, so it's left out
+    return BlockView(bytes(ciphertext), keysize).iter_full()
 
 def is_aes_ecb(ciphertext: bytes, keysize: int = 16):
-    chunks = chunk_text(ciphertext, keysize)
-    chunk_freq = Counter(chunks)
+    # stop at the first repeated block
+    seen = set()
+    for block in iter_blocks(ciphertext, keysize):
+        if block in seen:
+            return True
+        seen.add(block)
+    return False
+
+def repeated_blocks(ciphertext: bytes, keysize: int = 16) -> Dict[str, int]:
+    # hex of every block that shows up more than once -> how many times it shows up
+    chunk_freq = Counter(iter_blocks(ciphertext, keysize))
+    return {block.hex(): freq for (block, freq) in chunk_freq.items() if freq > 1}
+
+def iter_records(data_file: Union[TextIO, BinaryIO], record_size: int = None) -> Iterator[Tuple[int, Union[str, bytes]]]:
+    """
+        Streams (record number, record) pairs. With no record_size the file is hex lines (records are
+        hex strings, blank lines skipped), otherwise it's raw binary split into record_size byte records.
+    """
+    if record_size is None:
+        for record_number, line in enumerate(data_file, start=1):
+            line = line.strip()
+            if line:
+                yield record_number, line
+    else:
+        record_number = 0
+        while True:
+            record = data_file.read(record_size)
+            if not record:
+                return
+            record_number += 1
+            yield record_number, record
 
-    repeated_chunks = [block for (block,freq) in chunk_freq.items() if freq > 1]
-    return len(repeated_chunks) > 0
+def scan_batch(batch: List[Tuple[int, Union[str, bytes]]], keysize: int = 16) -> Tuple[int, List[Tuple[int, Dict[str, int]]]]:
+    # module level so it can be shipped to worker processes
+    matches = []
+    for record_number, record in batch:
+        ciphertext = bytes.fromhex(record) if isinstance(record, str) else record
+        # cheap early-exit check first, only count blocks for the records that match
+        if is_aes_ecb(ciphertext, keysize):
+            matches.append((record_number, repeated_blocks(ciphertext, keysize)))
+    return len(batch), matches
+
+def scan_ecb(data_file: Union[TextIO, BinaryIO], keysize: int = 16, record_size: int = None, batch_size: int = 1024, processes: int = None) -> Iterator[Tuple[int, Dict[str, int]]]:
+    """
+        Yields (record number, {repeated block hex: count}) for every record in data_file that has a repeated
+        block, in file order. processes > 1 shards the batches of records across a process pool.
+    """
+    batches = batched(iter_records(data_file, record_size), batch_size)
+    batch_fn = partial(scan_batch, keysize=keysize)
+
+    for (_, matches) in map_batches(batch_fn, batches, processes):
+        yield from matches
 
 def find_in_list(lines: str) -> str:
     for line in lines:
@@ -27,9 +84,12 @@ def find_in_list(lines: str) -> str:
     return '--Not Found--'
 
 if __name__ == "__main__":
-    with open('./8.txt', 'rt') as data_file:
-        lines = data_file.readlines()
-        found = find_in_list(lines)
-        print(found)
+    # usage: python challenge8.py [path to hex lines] [record size, to scan raw binary records instead]
+    path = sys.argv[1] if len(sys.argv) > 1 else data_path('8.txt')
+    record_size = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    with open(path, 'rt' if record_size is None else 'rb') as data_file:
+        for record_number, block_counts in scan_ecb(data_file, record_size=record_size):
+            print(f'record {record_number}: {block_counts}')
         # only line with repeated block: b'\x08d\x9a\xf7\r\xc0oO\xd5\xd2\xd6\x9ctL\xd2\x83'
         # d880619740a8a19b7840a8a31c810a3d08649af70dc06f4fd5d2d69c744cd283e2dd052f6b641dbf9d11b0348542bb5708649af70dc06f4fd5d2d69c744cd2839475c9dfdbc1d46597949d9c7e82bf5a08649af70dc06f4fd5d2d69c744cd28397a93eab8d6aecd566489154789a6b0308649af70dc06f4fd5d2d69c744cd283d403180c98c8f6db1f2a3f9c4040deb0ab51b29933f2c123c58386b06fba186a
@@ -21,6 +21,17 @@ def pkcs7_padding(src: bytes, target_len: int) -> bytes:
 
     return src + (pad_byte * delta)
 
+def pkcs7_unpadding(src: bytes, block_size: int) -> bytes:
+    # the last byte says how many pad bytes there are, and every one of them has to be that value
+    if not src or len(src) % block_size:
+        raise ValueError('Invalid padding!')
+
+    delta = src[-1]
+    if delta < 1 or delta > block_size or src[-delta:] != bytes([delta]) * delta:
+        raise ValueError('Invalid padding!')
+
+    return src[:-delta]
+
 if __name__ == "__main__":
     src_text = "YELLOW SUBMARINE"
 
@@ -33,3 +44,9 @@ if __name__ == "__main__":
         print('assert passed!')
     except AssertionError:
         print(f'FAILURE: Actual value [{actual}] does not match expected value [{expected}]')
+
+    try:
+        assert pkcs7_unpadding(pkcs7_padding(b"YELLOW SUB", 16), 16) == b"YELLOW SUB"
+        print('unpadding assert passed!')
+    except AssertionError:
+        print('FAILURE: unpadding did not round trip')
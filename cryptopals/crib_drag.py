@@ -0,0 +1,190 @@
+"""
+    Crib dragging over ciphertexts that share a keystream
+
+    When every ciphertext was xor'd with the same keystream, C1 ^ C2 = P1 ^ P2 and the key drops out. Sliding
+    a guessed word (a crib) across P1 ^ P2 and xor'ing it in gives back the matching piece of the other
+    plaintext, and where the guess is right that piece reads like text.
+
+    dragger = CribDragger(ciphertexts)
+    hits = dragger.drag([b' the ', b' and '], lang_freq_map)
+    for (score, revealed, crib, i, j, offset) in hits:
+        ...
+
+    Every pair is xor'd once and cached. For each crib, the offsets where every revealed byte is printable are
+    found a whole pair at a time with bytes.translate and big int ANDs, so only those offsets ever get scored.
+"""
+
+import heapq
+import os
+from functools import partial
+from itertools import combinations
+from math import inf
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from challenge2 import fixed_xor
+from challenge3 import CHAR_CLASS, INVALID, chi_squared_scoring
+from challenge4 import batched, map_batches
+from challenge5 import text_xor
+
+# PRINTABLE_MASKS[c] maps a pair xor byte to 1 if xor'ing it with crib byte c gives printable text, else 0
+PRINTABLE_MASKS = [
+    bytes(int(CHAR_CLASS[b ^ c] != INVALID) for b in range(256))
+    for c in range(256)
+]
+
+# (score, revealed text, crib, ciphertext index i, ciphertext index j, offset)
+CribHit = Tuple[float, bytes, bytes, int, int, int]
+
+def printable_offsets(pair_xor: bytes, crib: bytes) -> List[int]:
+    """
+        Every offset where pair_xor[offset:offset+len(crib)] ^ crib is all printable.
+
+        Byte k of the crib only ever lines up with pair_xor[k:k+num_offsets], so each crib byte turns that
+        slice into a 0/1 mask with one translate call, and ANDing the masks (as big ints) leaves a 1 exactly
+        at the offsets where every byte passed.
+    """
+    num_offsets = len(pair_xor) - len(crib) + 1
+    if not crib or num_offsets <= 0:
+        return []
+
+    valid = -1
+    for k, crib_byte in enumerate(crib):
+        mask = pair_xor[k:k+num_offsets].translate(PRINTABLE_MASKS[crib_byte])
+        valid &= int.from_bytes(mask, 'big')
+        if not valid:
+            return []
+
+    valid_mask = valid.to_bytes(num_offsets, 'big')
+    offsets = []
+    offset = valid_mask.find(1)
+    while offset != -1:
+        offsets.append(offset)
+        offset = valid_mask.find(1, offset + 1)
+    return offsets
+
+def hit_order(hit: CribHit) -> Tuple[float, int, int, int, bytes]:
+    # lowest score first, ties go to the earliest pair, offset and then crib. a total order, so which hits make
+    # the top_k can't depend on how the pairs were batched
+    (score, _, crib, i, j, offset) = hit
+    return (score, i, j, offset, crib)
+
+def drag_batch(batch: List[Tuple[Tuple[int, int], bytes]], cribs: Sequence[bytes], lang_freq_map, top_k: int = 50, score_fn=chi_squared_scoring) -> List[CribHit]:
+    """
+        Module level so it can be shipped to worker processes, the pair xors travel with the batch.
+        Only the batch's top_k hits come back, anything below that can't make the overall top_k either.
+
+        Rather than xor'ing the crib in at every offset, the whole pair is xor'd once against the crib
+        repeated from each phase it's found at, and every revealed fragment is then just a slice of that.
+        The same fragment turns up a lot across pairs, so scores are remembered for the batch.
+    """
+    scores = {}
+
+    def hits() -> Iterator[CribHit]:
+        for (i, j), pair_xor in batch:
+            for crib in cribs:
+                crib_len = len(crib)
+                by_phase = {}
+                for offset in printable_offsets(pair_xor, crib):
+                    phase = offset % crib_len
+                    if phase not in by_phase:
+                        # rotated so crib[0] lines up with every offset in this phase
+                        by_phase[phase] = text_xor(pair_xor, crib[crib_len-phase:] + crib[:crib_len-phase])
+                    revealed = by_phase[phase][offset:offset+crib_len]
+
+                    score = scores.get(revealed)
+                    if score is None:
+                        score = scores[revealed] = score_fn(revealed, lang_freq_map)
+                    if score != inf:
+                        yield (score, revealed, crib, i, j, offset)
+
+    # fed from a generator, nsmallest never holds more than top_k hits
+    return heapq.nsmallest(top_k, hits(), key=hit_order)
+
+class CribDragger:
+    """
+        Holds the ciphertexts and their pairwise xors. pair_xors() is worked out on first use and kept,
+        so dragging more cribs later doesn't redo the quadratic part.
+    """
+
+    def __init__(self, ciphertexts: Sequence[bytes]):
+        self.ciphertexts = [bytes(ciphertext) for ciphertext in ciphertexts]
+        self._pair_xors = None
+
+    def pair_xors(self) -> Dict[Tuple[int, int], bytes]:
+        # (i, j) with i < j -> C_i ^ C_j, as long as the shorter of the two
+        if self._pair_xors is None:
+            self._pair_xors = {
+                (i, j): fixed_xor(self.ciphertexts[i], self.ciphertexts[j])
+                for (i, j) in combinations(range(len(self.ciphertexts)), 2)
+            }
+        return self._pair_xors
+
+    def drag(self, cribs: Sequence[bytes], lang_freq_map: Dict, top_k: int = 50, batch_size: int = 256, processes: int = None, score_fn=chi_squared_scoring) -> List[CribHit]:
+        """
+            Slides every crib across every pair and returns the top_k hits, lowest score first.
+
+            A hit (score, revealed, crib, i, j, offset) means: if crib sits at offset in plaintext i (or j),
+            then revealed sits at the same offset in the other one.
+            processes > 1 shards the pairs across a process pool.
+        """
+        cribs = [bytes(crib) for crib in cribs]
+        hits: List[CribHit] = []
+
+        batches = batched(self.pair_xors().items(), batch_size)
+        batch_fn = partial(drag_batch, cribs=cribs, lang_freq_map=lang_freq_map, top_k=top_k, score_fn=score_fn)
+
+        for batch_hits in map_batches(batch_fn, batches, processes):
+            # batches hand back at most top_k each, merged with the same order drag_batch picked them by
+            hits = heapq.nsmallest(top_k, hits + batch_hits, key=hit_order)
+        return hits
+
+if __name__ == "__main__":
+    import json
+    from ngram_model import load_model, ngram_scoring
+    from paths import data_path
+
+    with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file:
+        lang_freq_map = json.load(lang_freq_file)
+
+    plaintexts = [
+        b'Four score and seven years ago our fathers brought forth on this continent',
+        b'Now we are engaged in a great civil war, testing whether that nation',
+        b'We are met on a great battle-field of that war. We have come to dedicate',
+        b'It is altogether fitting and proper that we should do this.',
+        b'But, in a larger sense, we can not dedicate, we can not consecrate',
+    ]
+    keystream = os.urandom(max(map(len, plaintexts)))
+    ciphertexts = [fixed_xor(plaintext, keystream) for plaintext in plaintexts]
+    cribs = [b' and ', b' that ', b' great ']
+
+    pair_xor = fixed_xor(plaintexts[0], plaintexts[1])
+    assert printable_offsets(pair_xor, b' and ') == [
+        offset for offset in range(len(pair_xor) - 4)
+        if all(CHAR_CLASS[b] != INVALID for b in fixed_xor(pair_xor[offset:offset+5], b' and '))
+    ]
+
+    dragger = CribDragger(ciphertexts)
+    hits = dragger.drag(cribs, lang_freq_map, top_k=1000)
+
+    # the right guess has to be in there: ' great ' in plaintext 1 lets plaintext 2 show through
+    offset = plaintexts[1].find(b' great ')
+    assert (plaintexts[2][offset:offset+7], b' great ', 1, 2, offset) in [hit[1:] for hit in hits]
+    assert hits == dragger.drag(cribs, lang_freq_map, top_k=1000, processes=2)
+
+    # batches only hand back their own top_k, which mustn't change the overall top_k
+    assert len(drag_batch(list(dragger.pair_xors().items()), cribs, lang_freq_map, top_k=5)) == 5
+    assert hits[:20] == dragger.drag(cribs, lang_freq_map, top_k=20, batch_size=3)
+
+    # the same crib fragment scores the same wherever it turns up, so ties are common: whatever the batching,
+    # the order has to come out the same
+    for batch_size in (1, 2, 7):
+        assert hits[:25] == dragger.drag(cribs, lang_freq_map, top_k=25, batch_size=batch_size, processes=2)
+
+    # letter frequencies can't say much about 5 or 6 bytes, the ngram model ranks them far better
+    hits = dragger.drag(cribs, load_model(), top_k=10, score_fn=ngram_scoring)
+    (_, revealed, crib, i, j, offset) = hits[0]
+    assert revealed in (plaintexts[i][offset:offset+len(crib)], plaintexts[j][offset:offset+len(crib)])
+
+    for (score, revealed, crib, i, j, offset) in hits:
+        print(f'{score:6.2f}  pair ({i}, {j}) @ {offset:>2}  {crib!r:>10} -> {revealed!r}')
+    print('crib drag tests passed!')
@@ -0,0 +1,217 @@
+"""
+    Encryption oracles over HTTP
+
+    Real oracles sit behind a network, where every query costs a round trip. This is a tiny local server
+    that puts any oracle callable behind HTTP, and an asyncio client that keeps a pool of keep-alive
+    connections and runs up to `concurrency` queries at once.
+
+    python http_oracle.py serve [port] [delay in ms]    -> challenge12's oracle on 127.0.0.1
+    python http_oracle.py                               -> serves it in a thread and runs the attack against it
+
+    The protocol is one POST per query: the body is the input, the response body is the ciphertext.
+
+    HttpOracle is the blocking face of the client, so ByteAtATimeEcbAttack (or anything else taking an oracle
+    callable) runs unchanged against it. Its map(inputs) sends a batch of independent queries concurrently.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Tuple
+from urllib.parse import urlsplit
+
+def make_handler(oracle: Callable[[bytes], bytes], delay: float = 0.0):
+    class OracleHandler(BaseHTTPRequestHandler):
+        # keep-alive, so clients don't pay a new connection per query
+        protocol_version = 'HTTP/1.1'
+        # headers and body go out as separate writes, with Nagle on every response waits for a delayed ACK
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            input_bytes = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if delay:
+                time.sleep(delay) # stand in for network latency
+
+            try:
+                ciphertext = oracle(input_bytes)
+            except Exception as error:
+                self.send_error(500, str(error))
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header('Content-Length', str(len(ciphertext)))
+            self.end_headers()
+            self.wfile.write(ciphertext)
+
+        def log_message(self, format, *args):
+            pass # one line per query drowns everything else out
+
+    return OracleHandler
+
+def serve_oracle(oracle: Callable[[bytes], bytes], host: str = '127.0.0.1', port: int = 0, delay: float = 0.0) -> ThreadingHTTPServer:
+    # port 0 picks a free one, it's in server.server_address. call serve_forever() or start_in_thread()
+    server = ThreadingHTTPServer((host, port), make_handler(oracle, delay))
+    server.daemon_threads = True
+    return server
+
+def start_in_thread(server: ThreadingHTTPServer) -> str:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    (host, port) = server.server_address[:2]
+    return f'http://{host}:{port}/'
+
+class AsyncHttpOracle:
+    """
+        asyncio client for serve_oracle. At most `concurrency` queries are in flight at once, each on its own
+        keep-alive connection, and connections go back to the pool when their query is done.
+    """
+
+    def __init__(self, url: str, concurrency: int = 16):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def _request(self, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter], input_bytes: bytes) -> bytes:
+        (reader, writer) = connection
+        writer.write(
+            f'POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(input_bytes)}\r\n\r\n'.encode('ascii')
+            + input_bytes
+        )
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Oracle closed the connection!')
+        status = int(status_line.split()[1])
+
+        content_len = 0
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            (name, _, value) = header.partition(b':')
+            if name.strip().lower() == b'content-length':
+                content_len = int(value)
+
+        body = await reader.readexactly(content_len)
+        if status != 200:
+            raise RuntimeError(f'Oracle returned {status}: {body[:200]!r}')
+        return body
+
+    async def query(self, input_bytes: bytes) -> bytes:
+        async with self._semaphore:
+            # a pooled connection may have been dropped by the server while idle, a fresh one is tried once
+            for attempt in range(2):
+                if self._idle and attempt == 0:
+                    connection = self._idle.pop()
+                else:
+                    connection = await asyncio.open_connection(self.host, self.port)
+
+                reusable = False
+                try:
+                    ciphertext = await self._request(connection, bytes(input_bytes))
+                    reusable = True
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if attempt:
+                        raise
+                    continue
+                finally:
+                    # anything but a clean 200 (an error status, a dropped connection, cancellation) and the
+                    # connection is closed, so it never leaks or goes back to the pool in an unknown state
+                    if reusable:
+                        self._idle.append(connection)
+                    else:
+                        connection[1].close()
+
+                return ciphertext
+
+    async def query_many(self, inputs: List[bytes]) -> List[bytes]:
+        return await asyncio.gather(*(self.query(input_bytes) for input_bytes in inputs))
+
+    async def close(self):
+        while self._idle:
+            (_, writer) = self._idle.pop()
+            writer.close()
+            await writer.wait_closed()
+
+class HttpOracle:
+    """
+        Blocking oracle callable over AsyncHttpOracle. The event loop runs in a background thread, so this can
+        be handed to code that just calls oracle(input).
+    """
+
+    def __init__(self, url: str, concurrency: int = 16):
+        self.url = url
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        self._client = self._run(self._make_client(url, concurrency))
+
+    @staticmethod
+    async def _make_client(url: str, concurrency: int) -> AsyncHttpOracle:
+        # the semaphore has to be made inside the loop it'll be used from
+        return AsyncHttpOracle(url, concurrency)
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def __call__(self, input_bytes: bytes) -> bytes:
+        return self._run(self._client.query(input_bytes))
+
+    def map(self, inputs: List[bytes]) -> List[bytes]:
+        return self._run(self._client.query_many(inputs))
+
+    def close(self):
+        self._run(self._client.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+if __name__ == "__main__":
+    from base64 import b64decode
+    from challenge12 import UNKNOWN_STRING, ByteAtATimeEcbAttack, encryption_oracle
+    from oracle_instrumentation import InstrumentedOracle
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+        delay = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.0
+        server = serve_oracle(encryption_oracle, port=port, delay=delay)
+        print(f'serving challenge12 oracle on http://127.0.0.1:{server.server_address[1]}/')
+        server.serve_forever()
+
+    # an error status raises, and the connection it came back on is closed rather than leaked or reused
+    def failing_oracle(input_bytes: bytes) -> bytes:
+        if input_bytes == b'fail':
+            raise ValueError('bad input')
+        return input_bytes
+
+    with HttpOracle(start_in_thread(serve_oracle(failing_oracle))) as http_oracle:
+        try:
+            http_oracle(b'fail')
+            assert False, 'expected a RuntimeError'
+        except RuntimeError:
+            pass
+        assert not http_oracle._client._idle
+        assert http_oracle(b'ok') == b'ok'
+        assert len(http_oracle._client._idle) == 1
+
+    # 2ms per query stands in for a network round trip. 16 candidate blocks per query makes 16 independent
+    # queries per byte, which is where concurrency pays off
+    url = start_in_thread(serve_oracle(encryption_oracle, delay=0.002))
+    for concurrency in (1, 32):
+        with HttpOracle(url, concurrency) as http_oracle, InstrumentedOracle(http_oracle) as oracle:
+            attack = ByteAtATimeEcbAttack(oracle, candidates_per_query=16)
+            secret = attack.run()
+
+        assert secret == b64decode(UNKNOWN_STRING)
+        print(f'>> concurrency {concurrency:>2}: {attack.oracle_calls} queries in {oracle.wall_seconds:.2f}s ({attack.oracle_calls / oracle.wall_seconds:.0f} queries/sec)')
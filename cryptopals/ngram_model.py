@@ -0,0 +1,256 @@
+"""
+    Compiled n-gram scoring model
+
+    english_language_charachter_frequencies.json only knows about 26 case folded letters, so chi_squared_scoring
+    can't tell a space from a '%' or 'n' from 'N', which is how challenge6 ends up with "ioise" instead of "noise".
+
+    This model scores text with log probabilities of:
+        - unigrams over all 256 byte values
+        - bigrams over all 256 x 256 byte pairs
+        - quadgrams over case folded letters + one "anything else" symbol (27^4, 256^4 would be 16GB)
+
+    The counts live in english_ngram_counts.json and get compiled once into dense float32 arrays in a binary
+    file in the cache dir. Loading the model just mmaps that file, so it costs nothing per run.
+
+    python ngram_model.py count corpus.txt [...]   -> writes english_ngram_counts.json from plain text corpora
+    python ngram_model.py compile                  -> (re)builds the binary model
+
+    The shipped counts are from Isaac Newton's Opticks (4th edition, 1730), the public domain Project Gutenberg
+    transcription that the Go source tree carries as src/testdata/Isaac.Newton-Opticks.txt:
+
+    python ngram_model.py count /usr/local/go/src/testdata/Isaac.Newton-Opticks.txt
+
+    Corpora go through clean_corpus first, which drops the transcription's markup (_italics_, illustration
+    captions, tables, the producer credits) so only the prose itself is counted.
+"""
+
+import hashlib
+import json
+import math
+import re
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import Counter
+from math import inf
+from typing import Dict, Iterable
+
+from challenge2 import XOR_TABLE, cache_dir
+from challenge3 import CHAR_CLASS, HISTOGRAM_SCORERS, INVALID, ByteCounts
+from paths import data_path
+
+COUNTS_PATH = data_path('english_ngram_counts.json')
+
+MAGIC = b'NGRM'
+VERSION = 1
+# magic, version, byte order, source digest, then the lengths of the three arrays
+HEADER = struct.Struct('<4sI8s32sIII')
+
+# quadgrams are over case folded letters 0-25 and FOLDED_OTHER for everything else
+FOLDED_OTHER = 26
+FOLDED_SIZE = 27
+FOLD_TABLE = bytes([FOLDED_OTHER if char_class in (INVALID, 26) else char_class for char_class in CHAR_CLASS])
+FOLDED_CHARS = 'abcdefghijklmnopqrstuvwxyz_'
+
+UNIGRAM_LEN = 256
+BIGRAM_LEN = 256 * 256
+QUADGRAM_LEN = FOLDED_SIZE ** 4
+
+# Gutenberg transcription markup: the producer credits up to the first blank lines, [Illustration: ...] and
+# [Greek: ...] blocks, tables (rows drawn with |, borders and rules of - and +) and the underscores around italics
+GUTENBERG_CREDITS = re.compile(rb'\A\s*Produced by.*?\n\s*\n', re.DOTALL)
+GUTENBERG_BLOCKS = re.compile(rb'\[(?:Illustration|Greek)[^\]]*\]')
+TABLE_ROWS = re.compile(rb'^(?:.*\|.*|[-+ ]*--[-+ ]*)\n', re.MULTILINE)
+# layout rather than prose: indentation and runs of blank lines
+INDENTATION = re.compile(rb'^ +', re.MULTILINE)
+BLANK_LINES = re.compile(rb'\n{3,}')
+
+def clean_corpus(text: bytes) -> bytes:
+    text = text.replace(b'\r\n', b'\n')
+    text = GUTENBERG_CREDITS.sub(b'', text)
+    text = GUTENBERG_BLOCKS.sub(b'', text)
+    text = TABLE_ROWS.sub(b'', text)
+    text = INDENTATION.sub(b'', text)
+    text = BLANK_LINES.sub(b'\n\n', text)
+    return text.replace(b'_', b'')
+
+def count_ngrams(texts: Iterable[bytes]) -> Dict:
+    """
+        Counts unigrams, bigrams and folded quadgrams over plain text corpora, in the format stored in
+        english_ngram_counts.json (byte values as hex, quadgrams spelled with FOLDED_CHARS)
+    """
+    unigrams = Counter()
+    bigrams = Counter()
+    quadgrams = Counter()
+
+    for text in texts:
+        unigrams.update(text)
+        bigrams.update(zip(text, text[1:]))
+
+        folded = text.translate(FOLD_TABLE)
+        quadgrams.update(folded[i:i+4] for i in range(len(folded) - 3))
+
+    return {
+        'unigrams': {f'{b:02x}': count for (b, count) in sorted(unigrams.items())},
+        'bigrams': {f'{a:02x}{b:02x}': count for ((a, b), count) in sorted(bigrams.items())},
+        # single occurrences are mostly noise and would double the size of the file
+        'quadgrams': {
+            ''.join(FOLDED_CHARS[c] for c in quad): count
+            for (quad, count) in sorted(quadgrams.items()) if count > 1
+        },
+    }
+
+def log_prob_array(counts: Dict[int, int], size: int) -> array:
+    # log10 probabilities, anything never seen gets a floor a good bit below the rarest thing that was seen
+    total = sum(counts.values())
+    floor = math.log10(0.01 / total)
+
+    log_probs = array('f', [floor]) * size
+    for index, count in counts.items():
+        log_probs[index] = math.log10(count / total)
+    return log_probs
+
+def compiled_model_path() -> str:
+    return os.path.join(cache_dir(), 'english_ngrams.bin')
+
+def compile_model(counts_path: str = COUNTS_PATH, model_path: str = None) -> str:
+    model_path = model_path or compiled_model_path()
+
+    with open(counts_path, 'rb') as counts_file:
+        source = counts_file.read()
+    counts = json.loads(source)
+
+    unigrams = log_prob_array({int(b, 16): count for (b, count) in counts['unigrams'].items()}, UNIGRAM_LEN)
+    bigrams = log_prob_array({int(pair, 16): count for (pair, count) in counts['bigrams'].items()}, BIGRAM_LEN)
+    quadgrams = log_prob_array({
+        sum(FOLDED_CHARS.index(char) * FOLDED_SIZE ** (3 - i) for (i, char) in enumerate(quad)): count
+        for (quad, count) in counts['quadgrams'].items()
+    }, QUADGRAM_LEN)
+
+    header = HEADER.pack(MAGIC, VERSION, sys.byteorder.encode('ascii'), hashlib.sha256(source).digest(), UNIGRAM_LEN, BIGRAM_LEN, QUADGRAM_LEN)
+
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    # write then rename, so another process never maps a half written file
+    tmp_path = f'{model_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as model_file:
+        model_file.write(header)
+        for log_probs in (unigrams, bigrams, quadgrams):
+            log_probs.tofile(model_file)
+    os.replace(tmp_path, model_path)
+
+    return model_path
+
+class NgramModel:
+    """
+        Memory mapped view of a compiled model. unigrams/bigrams/quadgrams are flat float32 arrays of log10
+        probabilities indexed by byte value, (a << 8) | b, and the base-27 folded quadgram.
+    """
+
+    def __init__(self, model_path: str = None, counts_path: str = COUNTS_PATH):
+        self.model_path = model_path or compiled_model_path()
+        self.counts_path = counts_path
+
+        with open(counts_path, 'rb') as counts_file:
+            digest = hashlib.sha256(counts_file.read()).digest()
+
+        if not self._is_current(digest):
+            compile_model(counts_path, self.model_path)
+
+        with open(self.model_path, 'rb') as model_file:
+            self._mmap = mmap.mmap(model_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        floats = memoryview(self._mmap)[HEADER.size:].cast('f')
+        self.unigrams = floats[:UNIGRAM_LEN]
+        self.bigrams = floats[UNIGRAM_LEN:UNIGRAM_LEN + BIGRAM_LEN]
+        self.quadgrams = floats[UNIGRAM_LEN + BIGRAM_LEN:]
+
+    def _is_current(self, digest: bytes) -> bool:
+        try:
+            with open(self.model_path, 'rb') as model_file:
+                header = HEADER.unpack(model_file.read(HEADER.size))
+        except (OSError, struct.error):
+            return False
+        expected_byteorder = sys.byteorder.encode('ascii').ljust(8, b'\x00')
+        return header == (MAGIC, VERSION, expected_byteorder, digest, UNIGRAM_LEN, BIGRAM_LEN, QUADGRAM_LEN)
+
+    def __reduce__(self):
+        # mmaps can't be pickled, worker processes map the same file themselves
+        return (NgramModel, (self.model_path, self.counts_path))
+
+    def log_prob(self, text: bytes) -> float:
+        # mean unigram + bigram + quadgram log probability per byte, higher is more english
+        if not text:
+            return -inf
+
+        total = sum(map(self.unigrams.__getitem__, text))
+        total += sum(self.bigrams[(a << 8) | b] for (a, b) in zip(text, text[1:]))
+
+        folded = text.translate(FOLD_TABLE)
+        quad_index = 0
+        for i, c in enumerate(folded):
+            quad_index = (quad_index * FOLDED_SIZE + c) % QUADGRAM_LEN
+            if i >= 3:
+                total += self.quadgrams[quad_index]
+
+        return total / len(text)
+
+def is_printable(text: bytes) -> bool:
+    return all(CHAR_CLASS[b] != INVALID for b in set(text))
+
+def ngram_scoring(text: bytes, model: NgramModel) -> float:
+    # same contract as chi_squared_scoring: lower is better, inf = not printable ASCII
+    if not text or not is_printable(text):
+        return inf
+    return -model.log_prob(bytes(text))
+
+def ngram_histogram_scoring(counts: ByteCounts, key: int, model: NgramModel) -> float:
+    """
+        Unigram part of ngram_scoring(single_byte_xor(text, key)), worked out from the ciphertext byte_counts.
+        Unigrams over all 256 byte values already tell spaces, case and punctuation apart, which is what the
+        key search for a single column needs.
+    """
+    permutation = XOR_TABLE[key]
+    unigrams = model.unigrams
+
+    total = 0.0
+    len_text = 0
+    for cipher_byte, freq in counts:
+        plain_byte = permutation[cipher_byte]
+        if CHAR_CLASS[plain_byte] == INVALID:
+            return inf
+        total += freq * unigrams[plain_byte]
+        len_text += freq
+
+    if len_text == 0:
+        return inf
+    return -total / len_text
+
+# let char_freq_xor_decode score all 256 keys from one histogram with this model too
+HISTOGRAM_SCORERS[ngram_scoring] = ngram_histogram_scoring
+
+_default_model = None
+
+def load_model() -> NgramModel:
+    # the english model, compiled if needed and mapped once per process
+    global _default_model
+    if _default_model is None:
+        _default_model = NgramModel()
+    return _default_model
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == 'count':
+        texts = []
+        for path in sys.argv[2:]:
+            with open(path, 'rb') as corpus_file:
+                texts.append(clean_corpus(corpus_file.read()))
+        with open(COUNTS_PATH, 'w') as counts_file:
+            json.dump(count_ngrams(texts), counts_file, separators=(',', ':'))
+        print('wrote', COUNTS_PATH)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'compile':
+        print('wrote', compile_model())
+    else:
+        model = load_model()
+        for text in (b'Terminator X: Bring the noise', b'Terminator X: Bring the ioise'):
+            print(text, ngram_scoring(text, model))
@@ -0,0 +1,142 @@
+"""
+    Instrumentation for encryption oracles
+
+    Attacks are measured in oracle queries. Wrap any oracle callable to count how it gets used:
+
+    with InstrumentedOracle(encryption_oracle) as oracle:
+        run_attack(oracle)
+    print(oracle.summary())
+"""
+
+import json
+import math
+import time
+from typing import Callable, Dict, List
+
+# latencies go in log scale buckets, BUCKETS_PER_OCTAVE per doubling of nanoseconds,
+# so the histogram stays small however many calls get made
+BUCKETS_PER_OCTAVE = 4
+
+def payload_len(value) -> int:
+    # oracles take str or bytes, and some (challenge11) return (ciphertext, mode)
+    if isinstance(value, tuple):
+        value = value[0] if value else b''
+    if isinstance(value, str):
+        return len(value.encode('utf8'))
+    try:
+        return len(value)
+    except TypeError:
+        return 0
+
+def bucket_upper_bound_us(bucket: int) -> float:
+    return 2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1000
+
+class InstrumentedOracle:
+    """
+        Callable wrapper around an oracle that records the call count, input/output byte totals and a latency
+        histogram. As a context manager it also records the wall clock time spent inside the block.
+    """
+
+    def __init__(self, oracle: Callable):
+        self.oracle = oracle
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.wall_seconds = 0.0
+        self.histogram: Dict[int, int] = {}
+        self._entered_at = None
+
+    def __call__(self, input_value, *args, **kwargs):
+        start = time.perf_counter_ns()
+        result = self.oracle(input_value, *args, **kwargs)
+        elapsed_ns = time.perf_counter_ns() - start
+
+        self.calls += 1
+        self.bytes_in += payload_len(input_value)
+        self.bytes_out += payload_len(result)
+        self.total_seconds += elapsed_ns / 1e9
+        self.max_seconds = max(self.max_seconds, elapsed_ns / 1e9)
+
+        bucket = int(math.log2(max(elapsed_ns, 1)) * BUCKETS_PER_OCTAVE)
+        self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+
+        return result
+
+    def map(self, input_values: List) -> List:
+        """
+            Batched queries. If the wrapped oracle has its own map() (the concurrent http_oracle.HttpOracle)
+            the batch goes through it, and every query in it is recorded at the batch's mean latency.
+        """
+        oracle_map = getattr(self.oracle, 'map', None)
+        if oracle_map is None:
+            return [self(input_value) for input_value in input_values]
+
+        start = time.perf_counter_ns()
+        results = oracle_map(input_values)
+        elapsed_ns = time.perf_counter_ns() - start
+
+        mean_ns = elapsed_ns / max(len(input_values), 1)
+        bucket = int(math.log2(max(mean_ns, 1)) * BUCKETS_PER_OCTAVE)
+        for input_value, result in zip(input_values, results):
+            self.calls += 1
+            self.bytes_in += payload_len(input_value)
+            self.bytes_out += payload_len(result)
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + 1
+        self.total_seconds += elapsed_ns / 1e9
+        self.max_seconds = max(self.max_seconds, mean_ns / 1e9)
+
+        return results
+
+    def __enter__(self):
+        self._entered_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_seconds += time.perf_counter() - self._entered_at
+        self._entered_at = None
+        return False
+
+    def percentile_us(self, percentile: float) -> float:
+        # upper bound of the histogram bucket the percentile falls in, in microseconds. the top bucket's bound
+        # can be past anything actually recorded, so it's capped at the max
+        if not self.calls:
+            return 0.0
+
+        max_us = self.max_seconds * 1e6
+        wanted = percentile / 100 * self.calls
+        seen = 0
+        for bucket in sorted(self.histogram):
+            seen += self.histogram[bucket]
+            if seen >= wanted:
+                return min(bucket_upper_bound_us(bucket), max_us)
+        return min(bucket_upper_bound_us(max(self.histogram)), max_us)
+
+    def summary(self) -> Dict:
+        return {
+            'oracle': getattr(self.oracle, '__name__', repr(self.oracle)),
+            'calls': self.calls,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'total_seconds': self.total_seconds,
+            'wall_seconds': self.wall_seconds,
+            'latency_us': {
+                'mean': self.total_seconds / self.calls * 1e6 if self.calls else 0.0,
+                'p50': self.percentile_us(50),
+                'p90': self.percentile_us(90),
+                'p99': self.percentile_us(99),
+                'max': self.max_seconds * 1e6,
+            },
+            # upper bound of each bucket in microseconds -> number of calls
+            'histogram_us': {
+                f'{bucket_upper_bound_us(bucket):.3f}': self.histogram[bucket]
+                for bucket in sorted(self.histogram)
+            },
+        }
+
+    def to_json(self, **json_kwargs) -> str:
+        return json.dumps(self.summary(), **json_kwargs)
@@ -0,0 +1,174 @@
+"""
+    CBC padding oracle attack
+
+    An oracle that only says whether a CBC ciphertext decrypts to valid PKCS#7 padding is enough to decrypt
+    all of it. Plaintext block i is D(C[i]) ^ C[i-1], so sending (fake C[i-1], C[i]) and tweaking the fake
+    block a byte at a time until the padding is valid gives away D(C[i]) one byte at a time, without the key.
+
+    Every block only needs itself and its predecessor, so the blocks are recovered independently, one task
+    per block across a process pool. Byte guesses are tried most likely plaintext first (english text, and
+    padding values for the last block), which is what keeps the query count well under 128 per byte.
+
+    attack = PaddingOracleAttack(oracle)
+    plaintext = attack.run(ciphertext, init_vector)
+    print(attack.oracle_queries)
+"""
+
+import os
+import secrets
+import time
+from functools import partial
+from typing import Callable, List, Tuple
+
+from challenge7 import AES_BLOCK_SIZE
+from challenge9 import pkcs7_padding, pkcs7_unpadding
+from challenge10 import cipher_block_chaining
+
+# most likely plaintext bytes first: space, lowercase by english frequency, uppercase, punctuation and digits
+ENGLISH_CHARSET = b' etaoinshrdlcumwfgypbvkjxqzETAOINSHRDLCUMWFGYPBVKJXQZ.,\'"-!?;:\n0123456789()&/*+=%$#@_[]<>\t\r'
+PADDING_BYTES = bytes(range(1, AES_BLOCK_SIZE + 1))
+
+# oracle(ciphertext, init_vector) -> True if it decrypts to valid padding
+PaddingOracle = Callable[[bytes, bytes], bool]
+
+class CbcPaddingOracle:
+    """
+        The server side: encrypts with standard PKCS#7 (a whole pad block when aligned) and a random IV, and
+        answers whether a ciphertext decrypts to valid padding. A class, so it can be pickled to workers.
+    """
+
+    def __init__(self, key: bytes = None):
+        self.key = key or secrets.token_bytes(16)
+
+    def encrypt(self, plaintext: bytes) -> Tuple[bytes, bytes]:
+        init_vector = secrets.token_bytes(AES_BLOCK_SIZE)
+        padded = pkcs7_padding(plaintext, (len(plaintext) // AES_BLOCK_SIZE + 1) * AES_BLOCK_SIZE)
+        return cipher_block_chaining(padded, self.key, init_vector, 'encrypt', fast=True), init_vector
+
+    def __call__(self, ciphertext: bytes, init_vector: bytes) -> bool:
+        try:
+            pkcs7_unpadding(cipher_block_chaining(ciphertext, self.key, init_vector, 'decrypt', fast=True), AES_BLOCK_SIZE)
+            return True
+        except ValueError:
+            return False
+
+def guess_order(charset: bytes, is_last_block: bool) -> bytes:
+    # charset first, then every other byte value. the last block ends in padding, so those go first there
+    likely = (PADDING_BYTES + charset) if is_last_block else charset
+    likely = bytes(dict.fromkeys(likely))
+    return likely + bytes(b for b in range(256) if b not in likely)
+
+def recover_block(block_task: Tuple[int, bytes, bytes, bool], oracle: PaddingOracle, charset: bytes = ENGLISH_CHARSET) -> Tuple[int, bytes, int]:
+    """
+        Module level so it can be shipped to worker processes.
+        block_task is (block index, previous ciphertext block or IV, ciphertext block, is it the last block)
+        returns (block index, plaintext block, oracle queries it took)
+    """
+    (index, previous, block, is_last_block) = block_task
+    block_size = len(block)
+    order = guess_order(charset, is_last_block)
+
+    # intermediate[i] = D(block)[i], worked out from the end of the block backwards
+    intermediate = bytearray(block_size)
+    queries = 0
+
+    for pad_value in range(1, block_size + 1):
+        position = block_size - pad_value
+        fake_previous = bytearray(block_size)
+        for i in range(position + 1, block_size):
+            fake_previous[i] = intermediate[i] ^ pad_value
+
+        for plain_byte in order:
+            fake_previous[position] = previous[position] ^ plain_byte ^ pad_value
+            queries += 1
+            if not oracle(block, bytes(fake_previous)):
+                continue
+
+            if pad_value == 1 and position > 0:
+                # valid, but the real plaintext might have ended in \x02\x02 (or longer) by chance, in which case
+                # changing the byte before this one breaks it. \x01 padding doesn't care
+                fake_previous[position - 1] ^= 0xff
+                queries += 1
+                still_valid = oracle(block, bytes(fake_previous))
+                fake_previous[position - 1] ^= 0xff
+                if not still_valid:
+                    continue
+
+            intermediate[position] = fake_previous[position] ^ pad_value
+            break
+        else:
+            raise ValueError(f'No byte value gave valid padding at block {index} byte {position}, is this a padding oracle?')
+
+    plaintext = bytes(a ^ b for (a, b) in zip(intermediate, previous))
+    return index, plaintext, queries
+
+class PaddingOracleAttack:
+    """
+        Decrypts CBC ciphertexts through a padding oracle. oracle_queries is the cost of the attack (summed
+        over all workers), block_queries has it per block and seconds the wall clock time of the last run().
+
+        processes > 1 recovers blocks across a process pool (the oracle has to pickle), by default they are
+        recovered in this process.
+    """
+
+    def __init__(self, oracle: PaddingOracle, charset: bytes = ENGLISH_CHARSET, processes: int = None):
+        self.oracle = oracle
+        self.charset = charset
+        self.processes = processes
+        self.oracle_queries = 0
+        self.block_queries: List[int] = []
+        self.seconds = 0.0
+
+    def run(self, ciphertext: bytes, init_vector: bytes, unpad: bool = True) -> bytes:
+        if not ciphertext or len(ciphertext) % AES_BLOCK_SIZE:
+            raise ValueError('Ciphertext length must be a multiple of the block size!')
+
+        start = time.perf_counter()
+        blocks = [ciphertext[i:i+AES_BLOCK_SIZE] for i in range(0, len(ciphertext), AES_BLOCK_SIZE)]
+        block_tasks = [
+            (index, blocks[index - 1] if index else init_vector, block, index == len(blocks) - 1)
+            for (index, block) in enumerate(blocks)
+        ]
+        block_fn = partial(recover_block, oracle=self.oracle, charset=self.charset)
+
+        processes = self.processes
+        if processes is not None and processes > 1 and len(block_tasks) > 1:
+            from concurrent.futures import ProcessPoolExecutor # only paid for when a pool is used
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                chunksize = max(1, len(block_tasks) // (processes * 4))
+                recovered = list(executor.map(block_fn, block_tasks, chunksize=chunksize))
+        else:
+            recovered = [block_fn(task) for task in block_tasks]
+
+        recovered.sort()
+        self.block_queries = [queries for (_, _, queries) in recovered]
+        self.oracle_queries += sum(self.block_queries)
+        self.seconds = time.perf_counter() - start
+
+        plaintext = b''.join(block for (_, block, _) in recovered)
+        return pkcs7_unpadding(plaintext, AES_BLOCK_SIZE) if unpad else plaintext
+
+if __name__ == "__main__":
+    from challenge7 import Tests
+
+    oracle = CbcPaddingOracle()
+    expected = (Tests.get_gettysberg_address() * 2).encode('utf8')
+    (ciphertext, init_vector) = oracle.encrypt(expected)
+
+    for processes in sorted({1, os.cpu_count() or 1}):
+        attack = PaddingOracleAttack(oracle, processes=processes)
+        actual = attack.run(ciphertext, init_vector)
+        assert actual == expected
+        print(f'>> {processes} process(es): {len(ciphertext)} bytes in {attack.seconds:.2f}s, '
+              f'{attack.oracle_queries} oracle queries ({attack.oracle_queries / len(ciphertext):.1f} per byte)')
+
+    # no charset, every byte value in order: what the pruning saves
+    attack = PaddingOracleAttack(oracle, charset=b'', processes=1)
+    assert attack.run(ciphertext[:160], init_vector, unpad=False) == expected[:160]
+    print(f'>> without the charset: {attack.oracle_queries / 160:.1f} queries per byte')
+
+    # random plaintext with no english in it still comes out, just with more queries
+    random_plaintext = secrets.token_bytes(100)
+    (ciphertext, init_vector) = oracle.encrypt(random_plaintext)
+    assert PaddingOracleAttack(oracle, processes=1).run(ciphertext, init_vector) == random_plaintext
+    print('padding oracle tests passed!')
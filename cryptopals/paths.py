@@ -0,0 +1,7 @@
+import os
+
+PACKAGE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+def data_path(filename: str) -> str:
+    # data files live next to the challenges, wherever they're run from
+    return os.path.join(PACKAGE_DIR, filename)
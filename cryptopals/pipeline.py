@@ -0,0 +1,167 @@
+"""
+    Composable streaming pipeline
+
+    Each stage is a generator function that takes an iterator of byte chunks and yields transformed chunks,
+    so multi-gigabyte inputs flow through with memory bounded by the chunk size:
+
+    plaintext = run_pipeline(
+        open('7.txt', 'rb'),
+        b64_decode,
+        partial(ecb_decrypt, key=b"YELLOW SUBMARINE"),
+        pkcs7_unpad,
+        utf8_decode,
+    )
+    for text in plaintext:
+        print(text, end='')
+
+    Chunks may be memoryviews into buffers that get reused, so a stage has to be done with a chunk
+    (or copy what it keeps) before asking for the next one.
+"""
+
+import base64
+import binascii
+import codecs
+from typing import Callable, Iterable, Iterator
+
+from challenge5 import DEFAULT_CHUNK_SIZE, ByteSource, iter_chunks, stream_text_xor
+
+WHITESPACE = b' \t\r\n\x0b\x0c'
+
+Chunks = Iterable[bytes]
+
+def run_pipeline(source: ByteSource, *stages: Callable[[Chunks], Iterator], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator:
+    chunks = iter_chunks(source, chunk_size)
+    for stage in stages:
+        chunks = stage(chunks)
+    return chunks
+
+def b64_decode(chunks: Chunks) -> Iterator[bytes]:
+    # base64 decodes in groups of 4 characters, any partial group waits for the next chunk
+    leftover = b''
+    for chunk in chunks:
+        data = leftover + bytes(chunk).translate(None, WHITESPACE)
+        usable_len = len(data) - len(data) % 4
+        leftover = data[usable_len:]
+        if usable_len:
+            yield base64.b64decode(data[:usable_len])
+
+    if leftover:
+        raise ValueError('Incomplete base64 input!')
+
+def b64_encode(chunks: Chunks) -> Iterator[bytes]:
+    # 3 bytes in -> 4 characters out, so only multiples of 3 get encoded until the end
+    leftover = b''
+    for chunk in chunks:
+        data = leftover + bytes(chunk)
+        usable_len = len(data) - len(data) % 3
+        leftover = data[usable_len:]
+        if usable_len:
+            yield base64.b64encode(data[:usable_len])
+
+    if leftover:
+        yield base64.b64encode(leftover)
+
+def hex_decode(chunks: Chunks) -> Iterator[bytes]:
+    # 2 hex characters per byte, an odd one out waits for the next chunk
+    leftover = b''
+    for chunk in chunks:
+        data = leftover + bytes(chunk).translate(None, WHITESPACE)
+        usable_len = len(data) - len(data) % 2
+        leftover = data[usable_len:]
+        if usable_len:
+            yield binascii.unhexlify(data[:usable_len])
+
+    if leftover:
+        raise ValueError('Odd-length hex input!')
+
+def xor_stream(chunks: Chunks, key: bytes) -> Iterator[memoryview]:
+    # repeating-key xor, the key position carries across chunks
+    return stream_text_xor(chunks, key)
+
+def ecb_encrypt(chunks: Chunks, key: bytes) -> Iterator[bytes]:
+    # standard PKCS#7, so block aligned input still comes back out of ecb_decrypt + pkcs7_unpad
+    from challenge7 import AesEcbStream
+    stream = AesEcbStream(key, 'encrypt', full_block_padding=True)
+    for chunk in chunks:
+        yield stream.update(chunk)
+    yield stream.finalize()
+
+def ecb_decrypt(chunks: Chunks, key: bytes) -> Iterator[bytes]:
+    from challenge7 import AesEcbStream
+    stream = AesEcbStream(key, 'decrypt')
+    for chunk in chunks:
+        yield stream.update(chunk)
+    yield stream.finalize()
+
+def cbc_encrypt(chunks: Chunks, key: bytes, init_vector: bytes) -> Iterator[bytes]:
+    # standard PKCS#7, same as ecb_encrypt
+    from challenge10 import CbcEncryptor
+    encryptor = CbcEncryptor(key, init_vector, full_block_padding=True)
+    for chunk in chunks:
+        yield encryptor.update(chunk)
+    yield encryptor.finalize()
+
+def cbc_decrypt(chunks: Chunks, key: bytes, init_vector: bytes) -> Iterator[bytes]:
+    # every aligned run of blocks goes through cbc_decrypt_bulk, with the last ciphertext block as the next IV
+    from challenge7 import AES_BLOCK_SIZE
+    from challenge10 import cbc_decrypt_bulk
+
+    leftover = b''
+    for chunk in chunks:
+        data = leftover + bytes(chunk)
+        usable_len = len(data) - len(data) % AES_BLOCK_SIZE
+        leftover = data[usable_len:]
+        if usable_len:
+            yield cbc_decrypt_bulk(data[:usable_len], key, init_vector, unpad=False)
+            init_vector = data[usable_len - AES_BLOCK_SIZE:usable_len]
+
+    if leftover:
+        raise ValueError('Ciphertext length must be a multiple of the block size!')
+
+def pkcs7_unpad(chunks: Chunks, block_size: int = 16) -> Iterator[bytes]:
+    # always hold back the last full block, only the very last one gets its padding stripped
+    from challenge9 import pkcs7_unpadding
+
+    held = b''
+    for chunk in chunks:
+        data = held + bytes(chunk)
+        keep_len = block_size + len(data) % block_size
+        if len(data) > keep_len:
+            yield data[:-keep_len]
+            held = data[-keep_len:]
+        else:
+            held = data
+
+    yield pkcs7_unpadding(held, block_size)
+
+def utf8_decode(chunks: Chunks) -> Iterator[str]:
+    # multi-byte characters split across chunks are held until they're complete
+    decoder = codecs.getincrementaldecoder('utf8')()
+    for chunk in chunks:
+        text = decoder.decode(bytes(chunk))
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+if __name__ == "__main__":
+    from functools import partial
+
+    key = b"YELLOW SUBMARINE"
+    init_vector = bytes(16)
+
+    # block aligned lengths are the ones that need the whole pad block
+    for length in (0, 1, 15, 16, 17, 32, 48, 100):
+        plaintext = bytes(range(length))
+        for chunk_size in (1, 5, 16, 64):
+            encrypted = b''.join(map(bytes, run_pipeline(plaintext, partial(ecb_encrypt, key=key), chunk_size=chunk_size)))
+            assert len(encrypted) == (length // 16 + 1) * 16
+            decrypted = run_pipeline(encrypted, partial(ecb_decrypt, key=key), pkcs7_unpad, chunk_size=chunk_size)
+            assert b''.join(map(bytes, decrypted)) == plaintext
+
+            encrypted = b''.join(map(bytes, run_pipeline(plaintext, partial(cbc_encrypt, key=key, init_vector=init_vector), chunk_size=chunk_size)))
+            assert len(encrypted) == (length // 16 + 1) * 16
+            decrypted = run_pipeline(encrypted, partial(cbc_decrypt, key=key, init_vector=init_vector), pkcs7_unpad, chunk_size=chunk_size)
+            assert b''.join(map(bytes, decrypted)) == plaintext
+    print('pipeline tests passed!')
@@ -0,0 +1,133 @@
+"""
+    Opt-in profiling of the hot primitives
+
+    CRYPTOPALS_PROFILE=1 python challenge6.py                                       -> writes cryptopals_profile.folded
+    CRYPTOPALS_PROFILE=1 CRYPTOPALS_PROFILE_OUTPUT=out.folded python challenge6.py  -> writes out.folded
+
+    CRYPTOPALS_PROFILE is only a switch (unset, empty, 0, false, no and off all mean off), the file it writes
+    comes from CRYPTOPALS_PROFILE_OUTPUT. With it on, every function decorated with @profiled records its
+    call count, cumulative time and the bytes it was handed (the length of its first argument), and a
+    summary table goes to stderr at exit. The .folded file is in collapsed stack format (one
+    "outer;inner;innermost microseconds" line per call path, self time only), which flamegraph.pl,
+    speedscope and inferno all read.
+
+    Only @profiled functions and profile_section() blocks show up in the stacks. With profiling off,
+    @profiled hands back the function untouched, so it costs nothing. Worker processes aren't recorded.
+"""
+
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict
+
+PROFILE_ENV_VAR = 'CRYPTOPALS_PROFILE'
+OUTPUT_ENV_VAR = 'CRYPTOPALS_PROFILE_OUTPUT'
+DEFAULT_OUTPUT = 'cryptopals_profile.folded'
+
+def env_flag(name: str) -> bool:
+    return os.environ.get(name, '').strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+ENABLED = env_flag(PROFILE_ENV_VAR)
+
+class Profile:
+    def __init__(self):
+        import threading
+        self._local = threading.local()
+        # name -> [calls, cumulative ns, bytes]
+        self.totals: Dict[str, list] = {}
+        # "outer;inner" -> self time ns
+        self.collapsed: Dict[str, int] = {}
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            # entries are [name, ns spent in children]
+            stack = self._local.stack = []
+        return stack
+
+    def enter(self, name: str):
+        self._stack().append([name, 0])
+
+    def exit(self, name: str, elapsed_ns: int, num_bytes: int):
+        stack = self._stack()
+        path = ';'.join(frame[0] for frame in stack)
+        (_, children_ns) = stack.pop()
+        if stack:
+            stack[-1][1] += elapsed_ns
+
+        self.collapsed[path] = self.collapsed.get(path, 0) + elapsed_ns - children_ns
+
+        totals = self.totals.setdefault(name, [0, 0, 0])
+        totals[0] += 1
+        totals[1] += elapsed_ns
+        totals[2] += num_bytes
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w') as folded_file:
+            for stack, self_ns in sorted(self.collapsed.items()):
+                # flamegraph tools want whole numbers, microseconds keeps the file readable
+                if self_ns >= 1000:
+                    folded_file.write(f'{stack} {self_ns // 1000}\n')
+
+    def summary(self) -> str:
+        lines = [f'{"function":<28} {"calls":>10} {"cumulative s":>13} {"MB":>10} {"MB/s":>10}']
+        for name, (calls, total_ns, num_bytes) in sorted(self.totals.items(), key=lambda item: -item[1][1]):
+            seconds = total_ns / 1e9
+            megabytes = num_bytes / (1 << 20)
+            mb_per_sec = f'{megabytes / seconds:10.2f}' if seconds and num_bytes else f'{"-":>10}'
+            lines.append(f'{name:<28} {calls:>10} {seconds:>13.4f} {megabytes:>10.2f} {mb_per_sec}')
+        return '\n'.join(lines)
+
+PROFILE = Profile() if ENABLED else None
+
+def payload_len(value) -> int:
+    if isinstance(value, (bytes, bytearray, memoryview, str)):
+        return len(value)
+    return 0
+
+def profiled(fn: Callable) -> Callable:
+    if not ENABLED:
+        return fn
+
+    name = fn.__qualname__
+    perf_counter_ns = time.perf_counter_ns
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        PROFILE.enter(name)
+        start = perf_counter_ns()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            PROFILE.exit(name, perf_counter_ns() - start, payload_len(args[0]) if args else 0)
+    return wrapper
+
+@contextmanager
+def profile_section(name: str):
+    # groups the profiled calls made inside the block under name, in the stacks and the summary
+    if not ENABLED:
+        yield
+        return
+
+    PROFILE.enter(name)
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        PROFILE.exit(name, time.perf_counter_ns() - start, 0)
+
+def dump():
+    path = os.environ.get(OUTPUT_ENV_VAR) or DEFAULT_OUTPUT
+    PROFILE.write_collapsed(path)
+    print(PROFILE.summary(), file=sys.stderr)
+    print(f'>> collapsed stacks written to {path}', file=sys.stderr)
+
+if ENABLED:
+    import atexit
+    import multiprocessing
+
+    # only the process that was started gets to write the file, not pool workers
+    if multiprocessing.parent_process() is None:
+        atexit.register(dump)
@@ -0,0 +1,212 @@
+"""
+    Ciphertext triage
+
+    Walks a directory of unknown blobs and labels each one:
+
+        aes_ecb             a repeated 16 byte block (challenge8)
+        single_byte_xor     one key byte turns it into printable text (challenge3/4)
+        repeating_key_xor   a short repeating key turns it into printable text (challenge6)
+        cbc_or_random       block aligned, but nothing above fits (challenge11 would call it CBC)
+        unknown             none of the above
+        unreadable          couldn't be read (dangling symlink, no permission, ...), the walk carries on
+
+    python triage.py some_dir/ [--processes 4] [--json] [--no-cache]
+
+    Blobs may be raw binary, hex or base64 text. The detectors run cheapest first and a blob stops at the first
+    one that matches, so the Vigenère solver only ever sees what the cheap checks couldn't place. Results are
+    cached per content hash in the cache dir, so a re-run only classifies the files that changed.
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, Iterator, List, Tuple
+
+from challenge2 import cache_dir
+from challenge4 import batched, map_batches
+from paths import data_path
+
+# bump when the detectors change, so old cached labels aren't trusted
+TRIAGE_VERSION = 1
+# files per pool task. one blob can take a while to classify, so batches stay small
+BATCH_SIZE = 4
+
+HEX_CHARS = frozenset(b'0123456789abcdefABCDEF')
+BASE64_CHARS = frozenset(b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')
+WHITESPACE = b' \t\r\n\x0b\x0c'
+
+_lang_freq_map = None
+
+def lang_freq_map() -> Dict:
+    # loaded once per process, workers included
+    global _lang_freq_map
+    if _lang_freq_map is None:
+        with open(data_path('english_language_charachter_frequencies.json')) as lang_freq_file:
+            _lang_freq_map = json.load(lang_freq_file)
+    return _lang_freq_map
+
+def decode_blob(raw: bytes) -> Tuple[bytes, str]:
+    # (ciphertext, how it was stored). hex is checked first, every hex string is valid base64 too
+    text = raw.translate(None, WHITESPACE)
+    if text and len(text) % 2 == 0 and HEX_CHARS.issuperset(text):
+        return binascii.unhexlify(text), 'hex'
+    if text and len(text) % 4 == 0 and BASE64_CHARS.issuperset(text):
+        try:
+            return base64.b64decode(text, validate=True), 'base64'
+        except binascii.Error:
+            pass
+    return raw, 'raw'
+
+def shortest_period(key: str) -> str:
+    # a multiple of the real key size often scores best, 'keykey' is just 'key'
+    for period in range(1, len(key)):
+        if len(key) % period == 0 and key[:period] * (len(key) // period) == key:
+            return key[:period]
+    return key
+
+def classify(ciphertext: bytes) -> Dict:
+    """
+        Runs the detectors cheapest first and returns at the first match:
+        {'label': ..., plus 'key' and 'score' for the xor labels}
+    """
+    from challenge8 import is_aes_ecb
+
+    # one pass over the blocks
+    block_aligned = len(ciphertext) > 0 and len(ciphertext) % 16 == 0
+    if block_aligned and is_aes_ecb(ciphertext, 16):
+        return {'label': 'aes_ecb'}
+
+    # one histogram and 256 cheap scores
+    from challenge3 import char_freq_xor_decode, chi_squared_scoring
+    (score, _, key_char) = char_freq_xor_decode(ciphertext, lang_freq_map(), 'utf8', chi_squared_scoring)
+    if key_char is not None:
+        return {'label': 'single_byte_xor', 'key': key_char, 'score': score}
+
+    # key size search plus a column solve per candidate key size. the ngram model gets the case and
+    # punctuation of the key right where letter frequencies can't
+    from challenge6 import solve_vigenere
+    from ngram_model import load_model, ngram_scoring
+    candidates = solve_vigenere(ciphertext, load_model(), top_n=3, processes=1, score_fn=ngram_scoring) if len(ciphertext) > 1 else []
+    if candidates:
+        (key, _, score) = candidates[0]
+        return {'label': 'repeating_key_xor', 'key': shortest_period(key), 'score': score}
+
+    return {'label': 'cbc_or_random' if block_aligned else 'unknown'}
+
+def unreadable(error: OSError) -> Dict:
+    return {'label': 'unreadable', 'error': f'{type(error).__name__}: {error.strerror or error}'}
+
+def triage_file(path: str, digest: str) -> Dict:
+    # module level so it can be shipped to worker processes, the worker reads the file itself.
+    # digest is the file_digest the cache lookup already worked out, so the file isn't hashed twice
+    try:
+        with open(path, 'rb') as blob_file:
+            raw = blob_file.read()
+    except OSError as error:
+        return unreadable(error)
+    (ciphertext, encoding) = decode_blob(raw)
+
+    result = classify(ciphertext)
+    result.update({'sha256': digest, 'size': len(ciphertext), 'encoding': encoding})
+    return result
+
+def triage_batch(batch: List[Tuple[str, str, Dict]]) -> List[Tuple[str, str, Dict, bool]]:
+    # module level so it can be shipped to worker processes. (path, digest, cached result or None) in,
+    # (path, digest, result, was it cached) out, only the cache misses get classified
+    return [(path, digest, cached or triage_file(path, digest), cached is not None) for (path, digest, cached) in batch]
+
+def result_cache_dir() -> str:
+    return os.path.join(cache_dir(), 'triage')
+
+def cache_path(digest: str) -> str:
+    # one small file per content hash, spread over 256 directories
+    return os.path.join(result_cache_dir(), digest[:2], f'{digest}.json')
+
+def load_cached(digest: str) -> Dict:
+    try:
+        with open(cache_path(digest)) as cache_file:
+            cached = json.load(cache_file)
+        if cached['version'] == TRIAGE_VERSION:
+            return cached['result']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def store_cached(digest: str, result: Dict):
+    path = cache_path(digest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, two runs over the same corpus never see a half written entry
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as cache_file:
+            json.dump({'version': TRIAGE_VERSION, 'result': result}, cache_file)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass # can't cache, it just gets classified again next run
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as blob_file:
+        for chunk in iter(lambda: blob_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_files(root: str) -> Iterator[str]:
+    if os.path.isfile(root):
+        yield root
+        return
+    for (dirpath, dirnames, filenames) in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+def triage(root: str, processes: int = None, use_cache: bool = True) -> Iterator[Dict]:
+    """
+        Yields a result dict for every file under root, in walk order:
+        {'path', 'label', 'sha256', 'size', 'encoding', 'cached', and 'key'/'score' for the xor labels}
+        Files that can't be read come out as {'path', 'label': 'unreadable', 'error', 'cached'} and are never cached.
+        Cache hits only cost a hash of the file. processes > 1 classifies the misses across a process pool.
+    """
+    def finish(path: str, digest: str, result: Dict, cached: bool) -> Dict:
+        if use_cache and not cached and result['label'] != 'unreadable':
+            store_cached(digest, result)
+        return dict(result, path=path, cached=cached)
+
+    def lookups() -> Iterator[Tuple[str, str, Dict]]:
+        for path in iter_files(root):
+            try:
+                digest = file_digest(path)
+            except OSError:
+                # no digest and no cache entry, triage_file hits the same error and reports it
+                yield path, None, None
+                continue
+            yield path, digest, load_cached(digest) if use_cache else None
+
+    # results come out in walk order, cache hits ride along in their batch and come straight back
+    for results in map_batches(triage_batch, batched(lookups(), BATCH_SIZE), processes):
+        for (path, digest, result, cached) in results:
+            yield finish(path, digest, result, cached)
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description='label a directory of unknown ciphertexts')
+    parser.add_argument('root', help='directory (or single file) to triage')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes for the files not in the cache')
+    parser.add_argument('--json', action='store_true', help='one json object per file instead of a table')
+    parser.add_argument('--no-cache', action='store_true', help='ignore and don\'t update the result cache')
+    args = parser.parse_args(argv)
+
+    for result in triage(args.root, args.processes, use_cache=not args.no_cache):
+        if args.json:
+            print(json.dumps(result))
+        else:
+            key = repr(result['key']) if 'key' in result else result.get('error', '')
+            cached = '(cached)' if result['cached'] else ''
+            print(f"{result['label']:<18} {key:<32} {result['path']} {cached}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))